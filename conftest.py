@@ -0,0 +1,15 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def catalog_cache(settings):
+    """Isolated in-memory cache instead of Redis for every test"""
+    settings.CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+    from django.core.cache import cache
+    cache.clear()
+    yield cache
+    cache.clear()
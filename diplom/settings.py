@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'silk',
     'social_django',
@@ -217,3 +218,38 @@ REDIS_PORT = getenv('REDIS_PORT', default='6379')
 BROKER_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}/1'
 BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 3600}
 CELERY_RESULT_BACKEND = f'redis://{REDIS_HOST}:{REDIS_PORT}/2'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'redis://{REDIS_HOST}:{REDIS_PORT}/3',
+    }
+}
+# время жизни ответов каталога, изменения каталога сбрасывают кэш сразу
+CATALOG_CACHE_TIMEOUT = int(getenv('CATALOG_CACHE_TIMEOUT',
+                                   default='3600'))
+
+# прайсы длиннее этого числа строк загружаются частями параллельно
+PRICE_LIST_CHUNK_SIZE = int(getenv('PRICE_LIST_CHUNK_SIZE',
+                                   default='20000'))
+# прайсы от этого числа строк загружаются через COPY во временные таблицы
+PRICE_LIST_COPY_THRESHOLD = int(getenv('PRICE_LIST_COPY_THRESHOLD',
+                                       default='100000'))
+# незавершенная загрузка прайса старше этого числа секунд считается зависшей
+PRICE_LIST_JOB_TIMEOUT = int(getenv('PRICE_LIST_JOB_TIMEOUT',
+                                    default='3600'))
+
+# пауза перед повтором неудачной периодической загрузки в секундах,
+# удваивается с каждой ошибкой подряд до максимума
+PRICE_LIST_RETRY_DELAY = int(getenv('PRICE_LIST_RETRY_DELAY',
+                                    default='300'))
+PRICE_LIST_RETRY_MAX_DELAY = int(getenv('PRICE_LIST_RETRY_MAX_DELAY',
+                                        default='86400'))
+
+# периодическая загрузка прайсов магазинов, у которых истек интервал
+CELERYBEAT_SCHEDULE = {
+    'refresh-price-lists': {
+        'task': 'partners.tasks.__refresh_price_lists',
+        'schedule': int(getenv('PRICE_LIST_REFRESH_PERIOD', default='60')),
+    },
+}
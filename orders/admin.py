@@ -6,10 +6,11 @@ from orders.models import Order, OrderItem
 class OrderItemsInline(admin.TabularInline):
     model = OrderItem
     extra = 0
+    readonly_fields = ['price']
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'status', 'dt', 'contact', 'user']
+    list_display = ['id', 'status', 'dt', 'contact', 'user', 'total_sum']
     ordering = ['dt']
     inlines = [OrderItemsInline]
@@ -0,0 +1,205 @@
+from django.db import IntegrityError, connection, transaction
+
+from orders.models import Order, OrderItem
+from products.cache import invalidate_catalog
+from products.models import CatalogOffer, ProductInfo
+
+TABLES = {'catalog': CatalogOffer._meta.db_table,
+          'order': Order._meta.db_table,
+          'order_item': OrderItem._meta.db_table,
+          'product_info': ProductInfo._meta.db_table}
+
+# одна вставка на всю пачку, существующие позиции корзины
+# по ограничению unique_order_item увеличивают количество
+ADD_ITEMS_SQL = """
+    INSERT INTO {order_item} (order_id, product_info_id, quantity)
+    SELECT %s, item.product_info_id, item.quantity
+    FROM unnest(%s::bigint[], %s::integer[])
+         AS item(product_info_id, quantity)
+    ON CONFLICT (order_id, product_info_id)
+    DO UPDATE SET quantity = {order_item}.quantity + EXCLUDED.quantity
+    RETURNING product_info_id, id, quantity, xmax = 0
+"""
+
+# изменение количества и удаление позиций корзины одним запросом,
+# удаляемые позиции не обновляются
+CHANGE_ITEMS_SQL = """
+    WITH basket AS (
+        SELECT id FROM {order} WHERE user_id = %(user)s AND status = 'basket'
+    ), changes AS (
+        SELECT * FROM unnest(%(ids)s::bigint[], %(quantities)s::integer[])
+                 AS change(id, quantity)
+    ), removed AS (
+        DELETE FROM {order_item} i
+        USING basket
+        WHERE i.order_id = basket.id AND i.id = ANY(%(removed)s::bigint[])
+        RETURNING i.id
+    ), updated AS (
+        UPDATE {order_item} i SET quantity = changes.quantity
+        FROM basket, changes
+        WHERE i.order_id = basket.id AND i.id = changes.id
+          AND i.id <> ALL(%(removed)s::bigint[])
+        RETURNING i.id
+    )
+    SELECT (SELECT count(*) FROM updated), (SELECT count(*) FROM removed)
+"""
+
+# блокировка корзины от повторного оформления и ее позиции
+LOCK_BASKET_SQL = """
+    SELECT i.product_info_id, i.quantity
+    FROM {order} o
+    LEFT JOIN {order_item} i ON i.order_id = o.id
+    WHERE o.id = %(order)s AND o.user_id = %(user)s AND o.status = 'basket'
+    ORDER BY i.product_info_id
+    FOR UPDATE OF o
+"""
+
+# строки предложений блокируются в порядке ИД, поэтому встречные
+# оформления с теми же товарами не могут взаимно заблокироваться
+LOCK_STOCK_SQL = """
+    SELECT id, quantity FROM {product_info}
+    WHERE id = ANY(%s)
+    ORDER BY id
+    FOR UPDATE
+"""
+
+# списание остатков только при достаточном количестве, каталог для
+# чтения получает новые остатки в том же запросе
+RESERVE_STOCK_SQL = """
+    WITH wanted AS (
+        SELECT * FROM unnest(%s::bigint[], %s::integer[])
+                 AS wanted(id, quantity)
+    ), stock AS (
+        UPDATE {product_info} p SET quantity = p.quantity - wanted.quantity
+        FROM wanted
+        WHERE p.id = wanted.id AND p.quantity >= wanted.quantity
+        RETURNING p.id, p.shop_id, p.quantity
+    ), catalog AS (
+        UPDATE {catalog} c SET quantity = stock.quantity
+        FROM stock
+        WHERE c.product_info_id = stock.id
+    )
+    SELECT id, shop_id FROM stock
+"""
+
+# цены позиций фиксируются при оформлении, строка заказа обновляется
+# один раз вместе со статусом и суммой
+PLACE_ORDER_SQL = """
+    WITH items AS (
+        UPDATE {order_item} i SET price = p.price
+        FROM {order} o, {product_info} p
+        WHERE o.id = %(order)s AND o.user_id = %(user)s
+          AND o.status = 'basket'
+          AND i.order_id = o.id AND p.id = i.product_info_id
+        RETURNING i.quantity::bigint * p.price AS amount
+    )
+    UPDATE {order}
+    SET status = 'new', contact_id = %(contact)s,
+        total_sum = (SELECT coalesce(sum(amount), 0) FROM items)
+    WHERE id = %(order)s AND user_id = %(user)s AND status = 'basket'
+"""
+
+REFRESH_TOTALS_SQL = """
+    WITH priced AS (
+        UPDATE {order_item} i SET price = p.price
+        FROM {order} o, {product_info} p
+        WHERE i.order_id = ANY(%s) AND i.price IS NULL
+          AND o.id = i.order_id AND o.status <> 'basket'
+          AND p.id = i.product_info_id
+    )
+    UPDATE {order} o SET total_sum = coalesce((
+        SELECT sum(i.quantity::bigint * coalesce(i.price, p.price))
+        FROM {order_item} i
+        JOIN {product_info} p ON p.id = i.product_info_id
+        WHERE i.order_id = o.id), 0)
+    WHERE o.id = ANY(%s) AND o.status <> 'basket'
+"""
+
+
+def add_items(order_id, quantities):
+    """
+    Добавляет позиции в заказ одним запросом
+
+    quantities - словарь {ИД предложения: количество}, повторы предложения
+    должны быть уже сложены. Возвращает словарь {ИД предложения:
+    (ИД позиции, итоговое количество, позиция создана)}.
+    """
+    if not quantities:
+        return {}
+    with connection.cursor() as cursor:
+        cursor.execute(ADD_ITEMS_SQL.format(**TABLES),
+                       [order_id, list(quantities), list(quantities.values())])
+        return {row[0]: row[1:] for row in cursor.fetchall()}
+
+
+def change_items(user_id, quantities=None, removed=()):
+    """
+    Меняет количество и удаляет позиции корзины пользователя одним
+    запросом
+
+    quantities - словарь {ИД позиции: количество}, removed - ИД удаляемых
+    позиций. Позиции чужих заказов не затрагиваются. Возвращает число
+    обновленных и удаленных позиций.
+    """
+    quantities = quantities or {}
+    if not quantities and not removed:
+        return 0, 0
+    with connection.cursor() as cursor:
+        cursor.execute(CHANGE_ITEMS_SQL.format(**TABLES),
+                       {'user': user_id,
+                        'ids': list(quantities),
+                        'quantities': list(quantities.values()),
+                        'removed': list(removed)})
+        return cursor.fetchone()
+
+
+def place_order(user_id, order_id, contact_id):
+    """
+    Оформляет корзину в одной транзакции: списывает остатки предложений,
+    сохраняет текущие цены позиций и сумму заказа
+
+    Блокируются только строка корзины и строки ее предложений в порядке
+    ИД, остатки списываются условным UPDATE. Возвращает пару (число
+    оформленных заказов, список нехватки {'product_info', 'quantity',
+    'available'}). При нехватке ничего не меняется.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        params = {'user': user_id, 'order': order_id, 'contact': contact_id}
+        cursor.execute(LOCK_BASKET_SQL.format(**TABLES), params)
+        lines = cursor.fetchall()
+        if not lines:
+            return 0, []
+        wanted = {product_info_id: quantity
+                  for product_info_id, quantity in lines
+                  if product_info_id is not None}
+
+        cursor.execute(LOCK_STOCK_SQL.format(**TABLES), [list(wanted)])
+        stock = dict(cursor.fetchall())
+        shortage = [{'product_info': product_info_id, 'quantity': quantity,
+                     'available': stock.get(product_info_id, 0)}
+                    for product_info_id, quantity in wanted.items()
+                    if stock.get(product_info_id, 0) < quantity]
+        if shortage:
+            return 0, shortage
+
+        cursor.execute(RESERVE_STOCK_SQL.format(**TABLES),
+                       [list(wanted), list(wanted.values())])
+        reserved = cursor.fetchall()
+        # строки заблокированы, поэтому списание не может не пройти,
+        # иначе транзакция откатывается целиком
+        if len(reserved) != len(wanted):
+            raise IntegrityError('Остатки предложений изменились')
+        cursor.execute(PLACE_ORDER_SQL.format(**TABLES), params)
+        invalidate_catalog(shop_id for _, shop_id in reserved)
+        return cursor.rowcount, []
+
+
+def refresh_totals(order_ids):
+    """
+    Пересчитывает суммы оформленных заказов после изменения позиций,
+    позиции без цены получают текущую цену предложения
+    """
+    with connection.cursor() as cursor:
+        order_ids = list(order_ids)
+        cursor.execute(REFRESH_TOTALS_SQL.format(**TABLES),
+                       [order_ids, order_ids])
@@ -0,0 +1,35 @@
+from django.db import transaction
+
+from products.cache import CATALOG_VERSION, bump_versions, get_versions, \
+    make_etag
+
+# заказы покупателя и заказы с товарами магазина по ИД его владельца
+USER_ORDERS_VERSION = 'orders:user:{}:version'
+PARTNER_ORDERS_VERSION = 'orders:partner:{}:version'
+
+
+def user_orders_version(user_id):
+    return USER_ORDERS_VERSION.format(user_id)
+
+
+def partner_orders_version(user_id):
+    return PARTNER_ORDERS_VERSION.format(user_id)
+
+
+def invalidate_orders(user_ids=(), partner_ids=()):
+    """
+    Увеличивает версии заказов после фиксации текущей транзакции
+    """
+    keys = [user_orders_version(user_id) for user_id in set(user_ids)] + \
+        [partner_orders_version(user_id) for user_id in set(partner_ids)
+         if user_id is not None]
+    if keys:
+        transaction.on_commit(lambda: bump_versions(keys))
+
+
+def orders_etag(request, keys):
+    """
+    ETag списка заказов, в ответ входят предложения каталога,
+    поэтому учитывается и версия каталога
+    """
+    return make_etag(request, *get_versions([*keys, CATALOG_VERSION]))
@@ -0,0 +1,25 @@
+from django.db.models import Exists, OuterRef
+from django_filters import FilterSet, filters
+
+from orders.models import Order, OrderItem, STATE_CHOICES
+
+
+class OrderFilter(FilterSet):
+    # корзина в истории заказов не выдается
+    status = filters.MultipleChoiceFilter(
+        choices=[choice for choice in STATE_CHOICES if choice[0] != 'basket'])
+    # dt_after и dt_before, даты включаются целиком
+    dt = filters.DateFromToRangeFilter()
+    shop_id = filters.NumberFilter(method='filter_shop')
+
+    class Meta:
+        model = Order
+        fields = ['status', 'dt']
+
+    def filter_shop(self, queryset, name, value):
+        """
+        Заказы с позициями магазина, подзапрос вместо соединения
+        не размножает строки заказов
+        """
+        return queryset.filter(Exists(OrderItem.objects.filter(
+            order_id=OuterRef('pk'), product_info__shop_id=value)))
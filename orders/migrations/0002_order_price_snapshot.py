@@ -0,0 +1,38 @@
+# Generated by Django 4.2.1 on 2026-10-18 22:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_sum',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True, verbose_name='Сумма'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='price',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Цена'),
+        ),
+        # оформленные заказы получают текущие цены, других данных нет
+        migrations.RunSQL(
+            """
+            UPDATE orders_orderitem i SET price = p.price
+            FROM products_productinfo p, orders_order o
+            WHERE p.id = i.product_info_id AND o.id = i.order_id
+              AND o.status <> 'basket';
+
+            UPDATE orders_order o SET total_sum = coalesce((
+                SELECT sum(i.quantity::bigint * i.price)
+                FROM orders_orderitem i WHERE i.order_id = o.id), 0)
+            WHERE o.status <> 'basket';
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.1 on 2026-10-18 22:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_order_price_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'status', '-dt', '-id'], name='order_user_status_dt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'basket'), _negated=True), fields=['user', '-dt', '-id'], name='order_user_dt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'basket'), _negated=True), fields=['-dt', '-id'], name='order_dt_idx'),
+        ),
+    ]
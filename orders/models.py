@@ -24,11 +24,26 @@ class Order(models.Model):
     contact = models.ForeignKey(Contact, verbose_name='Контакт',
                                 blank=True, null=True,
                                 on_delete=models.CASCADE)
+    # сумма по ценам позиций на момент оформления, у корзины не хранится
+    total_sum = models.PositiveBigIntegerField('Сумма', blank=True,
+                                               null=True, editable=False)
 
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = "Список заказов"
         ordering = ('-dt',)
+        indexes = [
+            # история заказов пользователя по статусу и без фильтра,
+            # порядок индекса совпадает с курсором пагинации (-dt, -pk)
+            models.Index(fields=['user', 'status', '-dt', '-id'],
+                         name='order_user_status_dt_idx'),
+            models.Index(fields=['user', '-dt', '-id'],
+                         name='order_user_dt_idx',
+                         condition=~models.Q(status='basket')),
+            # заказы поставщика проверяются подзапросом в порядке даты
+            models.Index(fields=['-dt', '-id'], name='order_dt_idx',
+                         condition=~models.Q(status='basket')),
+        ]
 
     def __str__(self):
         return str(self.dt)
@@ -43,6 +58,9 @@ class OrderItem(models.Model):
                                      verbose_name='Информация о продукте',
                                      related_name='ordered_items', blank=True,
                                      on_delete=models.CASCADE)
+    # цена за единицу на момент оформления заказа
+    price = models.PositiveIntegerField('Цена', blank=True, null=True,
+                                        editable=False)
 
     class Meta:
         verbose_name = 'Заказанная позиция'
@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OrderCursorPagination(CursorPagination):
+    """
+    Класс курсорной пагинации истории заказов от новых к старым
+
+    Страница выбирается условием по дате заказа вместо OFFSET и читается
+    по индексам (пользователь, статус, дата).
+    """
+    ordering = ('-dt', '-pk')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
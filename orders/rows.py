@@ -0,0 +1,116 @@
+from django.db.models import F
+from rest_framework.fields import DateTimeField
+
+from orders.models import OrderItem
+from products.rows import RowSerializer, ProductInfoRows
+
+
+class ContactRows(RowSerializer):
+    """
+    Контакт заказа в формате ContactSerializer
+    """
+    field_names = ('id', 'address', 'phone')
+    field_columns = {'id': ('contact_id',),
+                     'address': ('contact_address',),
+                     'phone': ('contact_phone',)}
+
+
+class OrderItemRows(RowSerializer):
+    """
+    Позиции заказа в формате OrderItemCreateSerializer
+    """
+    field_names = ('id', 'product_info', 'quantity', 'price')
+    field_columns = {'product_info': ('product_info_id',)}
+
+    def get_field(self, name, field_tree):
+        if name == 'product_info':
+            self.product_info = ProductInfoRows(field_tree)
+            return lambda row: self.product_info.to_representation(
+                row['product_info'])
+        return super().get_field(name, field_tree)
+
+    def fetch(self, order_ids):
+        """
+        Выбирает позиции заказов вместе с предложениями
+        и возвращает их списками по ИД заказа
+        """
+        rows = list(OrderItem.objects
+                    .filter(order_id__in=order_ids).order_by('id')
+                    .values('id', 'order_id', 'quantity', 'price',
+                            'product_info_id'))
+        if self.has_field('product_info'):
+            product_infos = self.product_info.fetch(
+                {row['product_info_id'] for row in rows})
+            for row in rows:
+                row['product_info'] = product_infos[row['product_info_id']]
+
+        items = {order_id: [] for order_id in order_ids}
+        for row in rows:
+            items[row['order_id']].append(row)
+        return items
+
+
+class OrderRows(RowSerializer):
+    """
+    Заказы в формате OrderSerializer
+
+    Заказ, позиции, предложения с продуктами и параметры выбираются
+    четырьмя запросами независимо от числа заказов.
+    """
+    field_names = ('id', 'ordered_items', 'status', 'dt', 'total_sum',
+                   'contact')
+    field_columns = {'ordered_items': (),
+                     'contact': ('contact_id',)}
+
+    def get_field(self, name, field_tree):
+        if name == 'ordered_items':
+            self.items = OrderItemRows(field_tree)
+            return lambda row: self.items.many(row['ordered_items'])
+        if name == 'dt':
+            to_representation = DateTimeField().to_representation
+            return lambda row: to_representation(row['dt'])
+        if name == 'contact':
+            contact = ContactRows(field_tree)
+            return lambda row: contact.to_representation(row) \
+                if row['contact_id'] is not None else None
+        return super().get_field(name, field_tree)
+
+    def values(self, queryset):
+        """
+        Строки заказов из queryset с колонками запрошенных полей,
+        дата выбирается всегда для курсора пагинации
+        """
+        related = {}
+        if self.has_field('contact'):
+            related = {'contact_address': F('contact__address'),
+                       'contact_phone': F('contact__phone')}
+        return queryset.values(*dict.fromkeys(['id', 'dt', *self.columns]),
+                               **related)
+
+    def add_items(self, rows):
+        """
+        Добавляет к выбранным строкам заказов их позиции
+        """
+        if self.has_field('ordered_items'):
+            items = self.items.fetch([row['id'] for row in rows])
+            for row in rows:
+                row['ordered_items'] = items[row['id']]
+        return rows
+
+    def fetch(self, queryset):
+        """
+        Выбирает строки заказов из queryset вместе с позициями
+        """
+        return self.add_items(list(self.values(queryset)))
+
+    def serialize(self, queryset):
+        return self.many(self.fetch(queryset))
+
+
+class BasketRows(OrderRows):
+    """
+    Корзина в формате OrderSerializer, сумма корзины не хранится и
+    считается по текущим ценам в аннотации current_sum
+    """
+    field_columns = {**OrderRows.field_columns,
+                     'total_sum': ('current_sum',)}
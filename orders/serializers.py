@@ -1,25 +1,35 @@
 from rest_framework import serializers
 
 from orders.models import OrderItem, Order
-from products.serializers import ProductInfoSerializer
+from products.serializers import ProductInfoSerializer, SparseFieldsMixin, \
+    is_requested
 from users.serializers import ContactSerializer
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = OrderItem
-        fields = ('id', 'product_info', 'quantity', 'order',)
-        read_only_fields = ('id',)
+        fields = ('id', 'product_info', 'quantity', 'price', 'order',)
+        read_only_fields = ('id', 'price',)
         extra_kwargs = {
             'order': {'write_only': True}
         }
 
 
+class BasketItemSerializer(serializers.Serializer):
+    """
+    Класс для проверки строки пакетного добавления в корзину без запросов
+    к базе, существование предложений проверяется одним запросом на пачку
+    """
+    product_info = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=0, max_value=2 ** 31 - 1)
+
+
 class OrderItemCreateSerializer(OrderItemSerializer):
     product_info = ProductInfoSerializer(read_only=True)
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     ordered_items = OrderItemCreateSerializer(read_only=True, many=True)
 
     total_sum = serializers.IntegerField()
@@ -30,3 +40,26 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ('id', 'ordered_items', 'status', 'dt',
                   'total_sum', 'contact',)
         read_only_fields = ('id',)
+
+    # связанные данные для каждого вложенного блока заказа
+    related_lookups = (
+        ('ordered_items', 'ordered_items'),
+        ('ordered_items.product_info', 'ordered_items__product_info'),
+        ('ordered_items.product_info.product',
+         'ordered_items__product_info__product__category'),
+        ('ordered_items.product_info.product_parameters',
+         'ordered_items__product_info__product_parameters__parameter'),
+    )
+
+    @classmethod
+    def setup_queryset(cls, queryset, field_tree=None):
+        """
+        Подгружает связанные данные только для запрошенных блоков
+        """
+        lookups = [lookup for path, lookup in cls.related_lookups
+                   if is_requested(field_tree, path)]
+        if lookups:
+            queryset = queryset.prefetch_related(*lookups)
+        if is_requested(field_tree, 'contact'):
+            queryset = queryset.select_related('contact')
+        return queryset
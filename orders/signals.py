@@ -0,0 +1,29 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from orders.basket import refresh_totals
+from orders.cache import invalidate_orders
+from orders.models import Order, OrderItem
+from products.models import ProductInfo
+
+# изменения через админку и модели, массовые изменения в представлениях
+# корзины и заказов сбрасывают версии и считают суммы сами
+
+
+@receiver([post_save, post_delete], sender=Order)
+def order_changed(sender, instance, **kwargs):
+    if kwargs['signal'] is post_save:
+        refresh_totals([instance.id])
+    invalidate_orders([instance.user_id],
+                      OrderItem.objects.filter(order_id=instance.id)
+                      .values_list('product_info__shop__user_id',
+                                   flat=True))
+
+
+@receiver([post_save, post_delete], sender=OrderItem)
+def order_item_changed(sender, instance, **kwargs):
+    refresh_totals([instance.order_id])
+    invalidate_orders(Order.objects.filter(id=instance.order_id)
+                      .values_list('user_id', flat=True),
+                      ProductInfo.objects.filter(id=instance.product_info_id)
+                      .values_list('shop__user_id', flat=True))
@@ -1,12 +1,25 @@
+import json
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from model_bakery import baker
 from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 
+from orders.basket import place_order
 from orders.models import OrderItem, Order
+from orders.rows import OrderRows
+from orders.serializers import OrderSerializer
 from partners.models import Shop
-from products.models import Product, Category, ProductInfo
+from products.models import Product, Category, ProductInfo, CatalogOffer, \
+    ProductParameter
+from products.serializers import parse_field_paths
 from users.models import User, Contact
 
 
@@ -84,6 +97,68 @@ def test_add_item_basket(client, user_factory, product_factory,
     assert data['Создано объектов'] == 1
 
 
+@pytest.mark.django_db
+def test_add_items_basket_batch(client, user_factory, product_factory,
+                                shop_factory, category_factory):
+    """Add a batch of items to basket with per-line results test"""
+    user, header_auth, contact = user_factory()
+    category = category_factory()
+    shop = shop_factory(user.id)
+    first, second = (product_factory(category.id, shop.id) for _ in range(2))
+    url = reverse('order_basket')
+    client.post(url, data={'items': json.dumps(
+        [{'product_info': first.id, 'quantity': 1}])}, headers=header_auth)
+
+    items = [{'product_info': first.id, 'quantity': 2},
+             {'product_info': second.id, 'quantity': 3},
+             {'product_info': second.id, 'quantity': 4},
+             {'product_info': second.id + 1000, 'quantity': 1},
+             {'product_info': first.id, 'quantity': -1},
+             'line']
+    response = client.post(url, data={'items': json.dumps(items)},
+                           headers=header_auth)
+
+    data = response.json()
+    assert data['Создано объектов'] == 1
+    assert data['Обновлено объектов'] == 1
+    results = data['items']
+    assert [line['Status'] for line in results] == [True, True, True,
+                                                    False, False, False]
+    assert results[0]['quantity'] == 3
+    assert not results[0]['created']
+    assert results[1]['quantity'] == results[2]['quantity'] == 7
+    assert results[1]['created']
+    assert 'product_info' in results[3]['Errors']
+    assert 'quantity' in results[4]['Errors']
+    assert dict(OrderItem.objects.values_list('product_info_id',
+                                              'quantity')) == {first.id: 3,
+                                                               second.id: 7}
+
+
+@pytest.mark.django_db
+def test_add_items_basket_queries(client, user_factory, product_factory,
+                                  shop_factory, category_factory):
+    """Batch basket add runs the same queries for any line count test"""
+    user, header_auth, contact = user_factory()
+    category = category_factory()
+    shop = shop_factory(user.id)
+    products = [product_factory(category.id, shop.id) for _ in range(30)]
+    url = reverse('order_basket')
+
+    def add(count):
+        items = [{'product_info': product.id, 'quantity': 1}
+                 for product in products[:count]]
+        with CaptureQueriesContext(connection) as context:
+            client.post(url, data={'items': json.dumps(items)},
+                        headers=header_auth)
+        return [query for query in context.captured_queries
+                if 'silk_' not in query['sql']]
+
+    add(1)
+    assert len(add(3)) == len(add(30))
+    assert OrderItem.objects.count() == 30
+
+
 @pytest.mark.django_db
 def test_get_item_basket(client, user_factory, shop_factory, order_factory,
                          product_factory, category_factory):
@@ -148,6 +223,50 @@ def test_del_item_basket(client, user_factory, shop_factory, order_factory,
     assert data['Удалено объектов'] == 1
 
 
+@pytest.mark.django_db
+def test_change_items_basket(client, user_factory, shop_factory,
+                             product_factory, category_factory,
+                             order_factory):
+    """Bulk basket update and removal run in one statement test"""
+    user, header_auth, contact = user_factory()
+    shop = shop_factory(user.id)
+    category = category_factory()
+    products = [product_factory(category.id, shop.id) for _ in range(20)]
+    basket = baker.make(Order, user=user, status='basket')
+    items = [baker.make(OrderItem, order=basket, product_info=product,
+                        quantity=1) for product in products]
+    other_order = order_factory(user.id, contact.id, products[0].id)
+    other_item = other_order.ordered_items.get()
+    url = reverse('order_basket')
+
+    changes = [{'id': item.id, 'quantity': 5} for item in items[:15]] + \
+        [{'id': items[15].id, 'quantity': 0},
+         {'id': other_item.id, 'quantity': 9}]
+    with CaptureQueriesContext(connection) as context:
+        response = client.put(url, data={'items': json.dumps(changes)},
+                              headers=header_auth)
+    data = response.json()
+    assert data['Обновлено объектов'] == 15
+    assert data['Удалено объектов'] == 1
+    assert len([query for query in context.captured_queries
+                if 'orders_orderitem' in query['sql']]) == 1
+
+    removed = ','.join(str(item.id) for item in items[16:]) + \
+        f',{other_item.id}'
+    with CaptureQueriesContext(connection) as context:
+        response = client.delete(url, data={'items': removed},
+                                 headers=header_auth)
+    assert response.json()['Удалено объектов'] == 4
+    assert len([query for query in context.captured_queries
+                if 'orders_orderitem' in query['sql']]) == 1
+
+    assert set(basket.ordered_items.values_list('quantity', flat=True)) \
+        == {5}
+    assert basket.ordered_items.count() == 15
+    other_item.refresh_from_db()
+    assert other_item.quantity == 1
+
+
 @pytest.mark.django_db
 def test_get_orders(client, user_factory, shop_factory, product_factory,
                     category_factory, order_factory):
@@ -165,7 +284,177 @@ def test_get_orders(client, user_factory, shop_factory, product_factory,
 
     data = response.json()
     print(data)
-    assert data[0]['ordered_items'][0]['product_info']['shop'] == shop.id
+    assert data['results'][0]['ordered_items'][0]['product_info']['shop'] \
+        == shop.id
+
+
+@pytest.mark.django_db
+def test_get_orders_fields(client, user_factory, shop_factory,
+                           product_factory, category_factory, order_factory):
+    """Get my orders with sparse fieldsets test"""
+    user, header_auth, contact = user_factory()
+    shop = shop_factory(user.id)
+    category = category_factory()
+    product = product_factory(category.id, shop.id)
+    order = order_factory(user.id, contact.id, product.id)
+    url = reverse('orders')
+
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url, data={'fields': 'id,status'},
+                              headers=header_auth)
+    assert response.json()['results'] == [{'id': order.id, 'status': 'new'}]
+    assert not [sql for sql in context.captured_queries
+                if 'orders_orderitem"."id" IN' in sql['sql']]
+
+    response = client.get(url, data={'fields': 'id,ordered_items.quantity',
+                                     'expand': 'contact'},
+                          headers=header_auth)
+    data = response.json()['results']
+    assert data[0]['ordered_items'] == [{'quantity': 1}]
+    assert data[0]['contact']['id'] == contact.id
+
+    response = client.get(
+        url, data={'fields': 'ordered_items.product_info.product.name'},
+        headers=header_auth)
+    assert response.json()['results'] == [{'ordered_items': [
+        {'product_info': {'product': {'name': product.product.name}}}]}]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('fields', [
+    None,
+    'id,dt,contact',
+    'ordered_items.product_info.product_parameters',
+    'total_sum,ordered_items.product_info.product.category',
+])
+def test_order_rows(user_factory, shop_factory, product_factory,
+                    category_factory, order_factory, fields):
+    """Order rows render the same JSON as OrderSerializer test"""
+    user, header_auth, contact = user_factory()
+    shop = shop_factory(user.id)
+    category = category_factory()
+    for _ in range(2):
+        product = product_factory(category.id, shop.id)
+        baker.make(ProductParameter, product_info=product, _quantity=2,
+                   _fill_optional=['parameter'])
+        order_factory(user.id, contact.id, product.id)
+    order_factory(user.id, None, product.id)
+    basket = order_factory(user.id, contact.id, product.id)
+    basket.status = 'basket'
+    basket.save()
+    queryset = Order.objects.exclude(id=basket.id).order_by('-dt')
+    field_tree = parse_field_paths(fields) if fields else None
+
+    serializer = OrderSerializer(
+        OrderSerializer.setup_queryset(queryset, field_tree), many=True,
+        field_tree=field_tree)
+    rows = OrderRows(field_tree).serialize(queryset)
+
+    assert JSONRenderer().render(rows) == \
+        JSONRenderer().render(serializer.data)
+
+
+@pytest.mark.django_db
+def test_get_orders_history(client, user_factory, shop_factory,
+                            product_factory, category_factory, order_factory):
+    """Order history cursor pagination and filters test"""
+    user, header_auth, contact = user_factory()
+    partner = baker.make(User, is_active=True, type='shop')
+    partner_auth = {'Authorization':
+                    f'Token {Token.objects.create(user=partner).key}'}
+    shops = [shop_factory(partner.id), shop_factory(user.id)]
+    category = category_factory()
+    products = [product_factory(category.id, shop.id) for shop in shops]
+    orders = []
+    for day, status in enumerate(('new', 'sent', 'new', 'delivered', 'new')):
+        order = order_factory(user.id, contact.id, products[day % 2].id)
+        Order.objects.filter(id=order.id).update(
+            status=status,
+            dt=datetime(2024, 1, day + 1, 12, tzinfo=timezone.utc))
+        orders.append(order.id)
+    basket = order_factory(user.id, contact.id, products[0].id)
+    basket.status = 'basket'
+    basket.save()
+    url = reverse('orders')
+
+    ids, page = [], client.get(url, data={'page_size': 2},
+                               headers=header_auth).json()
+    while True:
+        assert len(page['results']) <= 2
+        ids += [order['id'] for order in page['results']]
+        if not page['next']:
+            break
+        page = client.get(page['next'], headers=header_auth).json()
+    assert ids == orders[::-1]
+
+    def get_ids(**params):
+        response = client.get(url, data=params, headers=header_auth)
+        return [order['id'] for order in response.json()['results']]
+
+    assert get_ids(status='new') == [orders[4], orders[2], orders[0]]
+    assert get_ids(status=['sent', 'delivered']) == [orders[3], orders[1]]
+    assert get_ids(dt_after='2024-01-02', dt_before='2024-01-03') \
+        == [orders[2], orders[1]]
+    assert get_ids(shop_id=shops[1].id) == [orders[3], orders[1]]
+    assert get_ids(shop_id=shops[1].id, status='sent') == [orders[1]]
+    for params in ({'status': 'basket'}, {'dt_after': 'вчера'}):
+        assert client.get(url, data=params,
+                          headers=header_auth).status_code == 400
+
+    response = client.get(reverse('partner_orders'),
+                          data={'status': 'new', 'page_size': 2},
+                          headers=partner_auth)
+    data = response.json()
+    assert [order['id'] for order in data['results']] \
+        == [orders[4], orders[2]]
+    assert data['next']
+
+
+@pytest.mark.django_db
+def test_get_orders_etag(client, user_factory, shop_factory, product_factory,
+                         category_factory, order_factory,
+                         django_capture_on_commit_callbacks):
+    """Conditional GET of orders returns 304 until an order changes test"""
+    user, header_auth, contact = user_factory()
+    partner = baker.make(User, is_active=True, type='shop')
+    partner_auth = {'Authorization':
+                    f'Token {Token.objects.create(user=partner).key}'}
+    shop = shop_factory(partner.id)
+    category = category_factory()
+    product = product_factory(category.id, shop.id)
+    with django_capture_on_commit_callbacks(execute=True):
+        order = order_factory(user.id, contact.id, product.id)
+    url = reverse('orders')
+
+    etag = client.get(url, headers=header_auth)['ETag']
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url, headers={**header_auth,
+                                            'If-None-Match': etag})
+    assert response.status_code == 304
+    assert not [sql for sql in context.captured_queries
+                if 'orders_order' in sql['sql']]
+
+    partner_url = reverse('partner_orders')
+    partner_etag = client.get(partner_url, headers=partner_auth)['ETag']
+
+    order.status = 'confirmed'
+    with django_capture_on_commit_callbacks(execute=True):
+        order.save()
+    response = client.get(url, headers={**header_auth,
+                                        'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json()['results'][0]['status'] == 'confirmed'
+    response = client.get(partner_url,
+                          headers={**partner_auth,
+                                   'If-None-Match': partner_etag})
+    assert response.status_code == 200
+
+    etag = response['ETag']
+    with django_capture_on_commit_callbacks(execute=True):
+        product.save()
+    response = client.get(partner_url, headers={**partner_auth,
+                                                'If-None-Match': etag})
+    assert response.status_code == 200
 
 
 @pytest.mark.django_db
@@ -187,3 +476,146 @@ def test_make_order(client, user_factory, shop_factory, order_factory,
 
     data = response.json()
     assert data['Status']
+
+
+@pytest.mark.django_db
+def test_make_order_price_snapshot(client, user_factory, shop_factory,
+                                   category_factory, product_factory):
+    """Placed orders keep line prices and total after a price change test"""
+    user, header_auth, contact = user_factory()
+    shop = shop_factory(user.id)
+    category = category_factory()
+    first, second = (product_factory(category.id, shop.id)
+                     for _ in range(2))
+    first.price, second.price = 100, 250
+    first.save()
+    second.save()
+    url = reverse('order_basket')
+    client.post(url, data={'items': json.dumps(
+        [{'product_info': first.id, 'quantity': 3},
+         {'product_info': second.id, 'quantity': 2}])}, headers=header_auth)
+    basket = Order.objects.get(user=user, status='basket')
+
+    first.price = 120
+    first.save()
+    assert client.get(url, headers=header_auth).json()[0]['total_sum'] \
+        == 3 * 120 + 2 * 250
+
+    response = client.post(reverse('orders'),
+                           data={'id': basket.id, 'contact': contact.id},
+                           headers=header_auth)
+    assert response.json()['Status']
+    first.price = 500
+    first.save()
+
+    with CaptureQueriesContext(connection) as context:
+        data = client.get(reverse('orders'),
+                          headers=header_auth).json()['results']
+    assert data[0]['total_sum'] == 3 * 120 + 2 * 250
+    assert sorted(item['price'] for item in data[0]['ordered_items']) \
+        == [120, 250]
+    assert not [query for query in context.captured_queries
+                if 'SUM(' in query['sql']]
+
+    # повторное оформление не меняет зафиксированные цены
+    response = client.post(reverse('orders'),
+                           data={'id': basket.id, 'contact': contact.id},
+                           headers=header_auth)
+    assert not response.json()['Status']
+
+    item = OrderItem.objects.get(order=basket, product_info=first)
+    item.quantity = 1
+    item.save()
+    basket.refresh_from_db()
+    assert basket.total_sum == 120 + 2 * 250
+
+
+@pytest.mark.django_db
+def test_make_order_shortage(client, user_factory, shop_factory,
+                             category_factory, product_factory):
+    """Placing a basket with more than the stock keeps it unchanged test"""
+    user, header_auth, contact = user_factory()
+    shop = shop_factory(user.id)
+    category = category_factory()
+    first, second = (product_factory(category.id, shop.id)
+                     for _ in range(2))
+    first.quantity, second.quantity = 5, 1
+    first.save()
+    second.save()
+    client.post(reverse('order_basket'), data={'items': json.dumps(
+        [{'product_info': first.id, 'quantity': 3},
+         {'product_info': second.id, 'quantity': 2}])}, headers=header_auth)
+    basket = Order.objects.get(user=user, status='basket')
+
+    response = client.post(reverse('orders'),
+                           data={'id': basket.id, 'contact': contact.id},
+                           headers=header_auth)
+    data = response.json()
+    assert not data['Status']
+    assert data['items'] == [{'product_info': second.id, 'quantity': 2,
+                              'available': 1}]
+    basket.refresh_from_db()
+    assert basket.status == 'basket'
+    assert list(ProductInfo.objects.filter(id__in=[first.id, second.id])
+                .order_by('id').values_list('quantity', flat=True)) == [5, 1]
+
+    second.quantity = 2
+    second.save()
+    response = client.post(reverse('orders'),
+                           data={'id': basket.id, 'contact': contact.id},
+                           headers=header_auth)
+    assert response.json()['Status']
+    assert dict(CatalogOffer.objects
+                .filter(product_info_id__in=[first.id, second.id])
+                .values_list('product_info_id', 'quantity')) \
+        == {first.id: 2, second.id: 0}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_place_orders_concurrently(user_factory, shop_factory,
+                                   category_factory, product_factory,
+                                   record_property):
+    """Concurrent placements never oversell and do not deadlock test"""
+    buyers, hot_stock = 24, 10
+    user, _, _ = user_factory()
+    shop = shop_factory(user.id)
+    category = category_factory()
+    hot, first, second = (product_factory(category.id, shop.id)
+                          for _ in range(3))
+    hot.quantity, first.quantity, second.quantity = hot_stock, 1000, 1000
+    for product in (hot, first, second):
+        product.save()
+
+    baskets = []
+    for number in range(buyers):
+        buyer, _, contact = user_factory()
+        basket = baker.make(Order, user=buyer, contact=contact,
+                            status='basket')
+        # встречный порядок позиций в корзинах
+        products = (first, second) if number % 2 else (second, first)
+        for product in (*products, hot):
+            baker.make(OrderItem, order=basket, product_info=product,
+                       quantity=1)
+        baskets.append((buyer.id, basket.id, contact.id))
+
+    def place(basket):
+        try:
+            return place_order(*basket)
+        finally:
+            connection.close()
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(place, baskets))
+    elapsed = perf_counter() - start
+    record_property('placements_per_second', round(buyers / elapsed, 1))
+
+    placed = sum(is_placed for is_placed, _ in results)
+    assert placed == hot_stock
+    assert all(shortage for is_placed, shortage in results if not is_placed)
+    assert Order.objects.filter(status='new').count() == hot_stock
+    stock = dict(ProductInfo.objects.values_list('id', 'quantity'))
+    assert stock == {hot.id: 0, first.id: 1000 - hot_stock,
+                     second.id: 1000 - hot_stock}
+    assert dict(CatalogOffer.objects
+                .values_list('product_info_id', 'quantity')) == stock
@@ -1,13 +1,28 @@
-from django.db import IntegrityError
-from django.db.models import Sum, F, Q
+from django.db import IntegrityError, DataError, transaction
+from django.db.models import Sum, F
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.generics import GenericAPIView
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.relations import PrimaryKeyRelatedField
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from ujson import loads as load_json
 
 from diplom.celery import send_email
+from orders.basket import add_items, change_items, place_order
+from orders.cache import invalidate_orders, orders_etag, \
+    user_orders_version
+from orders.filters import OrderFilter
 from orders.models import Order, OrderItem
-from orders.serializers import OrderSerializer, OrderItemSerializer
+from orders.pagination import OrderCursorPagination
+from orders.rows import OrderRows, BasketRows
+from orders.serializers import BasketItemSerializer, OrderSerializer
+from products.cache import conditional_response
+from products.models import ProductInfo
+from products.serializers import requested_fields
+
+DOES_NOT_EXIST = PrimaryKeyRelatedField.default_error_messages[
+    'does_not_exist']
 
 
 class BasketView(APIView):
@@ -18,74 +33,102 @@ class BasketView(APIView):
 
     # получить корзину
     def get(self, request, *args, **kwargs):
+        # сумма корзины считается по текущим ценам предложений
         basket = Order.objects\
             .filter(user_id=request.user.id, status='basket')\
-            .prefetch_related(
-                'ordered_items__product_info__product__category',
-                'ordered_items__product_info__product_parameters__parameter')\
-            .annotate(total_sum=Sum(F('ordered_items__quantity') *
-                                    F('ordered_items__product_info__price')))\
-            .distinct()
-
-        serializer = OrderSerializer(basket, many=True)
-        return Response(serializer.data)
-
-    # редактировать корзину
+            .annotate(current_sum=Sum(
+                F('ordered_items__quantity') *
+                F('ordered_items__product_info__price')))\
+            .order_by('-dt')
+
+        # ответ собирается из строк .values() в формате OrderSerializer,
+        # 304 отдается по версиям заказов до запросов к заказам
+        rows = BasketRows(requested_fields(request))
+        etag = orders_etag(request, [user_orders_version(request.user.id)])
+        return conditional_response(
+            request, etag, lambda: Response(rows.serialize(basket)))
+
+    # добавить товары в корзину, количество уже добавленных увеличивается
     def post(self, request, *args, **kwargs):
         items_sting = request.data.get('items')
-        if items_sting:
-            try:
-                items_dict = load_json(items_sting)
-            except ValueError:
-                return Response(
-                    {'Status': False, 'Errors': 'Неверный формат запроса'})
-            else:
+        if not items_sting:
+            return Response({'Status': False,
+                             'Errors': 'Не указаны все необходимые аргументы'})
+        try:
+            items_list = load_json(items_sting)
+        except ValueError:
+            items_list = None
+        if not isinstance(items_list, list):
+            return Response(
+                {'Status': False, 'Errors': 'Неверный формат запроса'})
+
+        lines = [BasketItemSerializer(data=item) for item in items_list]
+        product_info_ids = {line.validated_data['product_info']
+                            for line in lines if line.is_valid()}
+        # снятые с продажи предложения в корзину не добавляются
+        existing = set(ProductInfo.objects
+                       .filter(id__in=product_info_ids, delisted=False)
+                       .values_list('id', flat=True))
+        # повторы предложения в пачке складываются в одну позицию
+        quantities = {}
+        for line in lines:
+            if line.is_valid() \
+                    and line.validated_data['product_info'] in existing:
+                product_info_id = line.validated_data['product_info']
+                quantities[product_info_id] = \
+                    quantities.get(product_info_id, 0) \
+                    + line.validated_data['quantity']
+
+        try:
+            with transaction.atomic():
                 basket, _ = Order.objects.get_or_create(
                     user_id=request.user.id, status='basket')
-                objects_created = 0
-                for order_item in items_dict:
-                    order_item.update({'order': basket.id})
-                    serializer = OrderItemSerializer(data=order_item)
-                    if serializer.is_valid():
-                        try:
-                            serializer.save()
-                        except IntegrityError as error:
-                            return Response({'Status': False,
-                                             'Errors': str(error)})
-                        else:
-                            objects_created += 1
-                    else:
-                        return Response({'Status': False,
-                                         'Errors': serializer.errors})
-
-                    return Response({'Status': True,
-                                     'Создано объектов': objects_created})
-                return Response({'Status': False,
-                                 'Errors': ('Не указаны все необходимые '
-                                            'аргументы')})
+                added = add_items(basket.id, quantities)
+        except (IntegrityError, DataError) as error:
+            return Response({'Status': False, 'Errors': str(error)})
+        if added:
+            invalidate_orders([request.user.id])
+
+        results = []
+        for line in lines:
+            if not line.is_valid():
+                results.append({'Status': False, 'Errors': line.errors})
+            elif line.validated_data['product_info'] not in added:
+                results.append({'Status': False, 'Errors': {
+                    'product_info': [DOES_NOT_EXIST.format(
+                        pk_value=line.validated_data['product_info'])]}})
+            else:
+                item_id, quantity, created = \
+                    added[line.validated_data['product_info']]
+                results.append({'Status': True, 'id': item_id,
+                                'product_info':
+                                    line.validated_data['product_info'],
+                                'quantity': quantity, 'created': created})
+        created = sum(1 for *_, is_created in added.values() if is_created)
+        return Response({'Status': True,
+                         'Создано объектов': created,
+                         'Обновлено объектов': len(added) - created,
+                         'items': results})
 
     # удалить товары из корзины
     def delete(self, request, *args, **kwargs):
         items_sting = request.data.get('items')
         if items_sting:
-            items_list = items_sting.split(',')
-            basket, _ = Order.objects.get_or_create(user_id=request.user.id,
-                                                    status='basket')
-            query = Q()
-            objects_deleted = False
-            for order_item_id in items_list:
-                if order_item_id.isdigit():
-                    query |= Q(order_id=basket.id, id=order_item_id)
-                    objects_deleted = True
-
-            if objects_deleted:
-                deleted_count = OrderItem.objects.filter(query).delete()[0]
+            removed = {int(order_item_id)
+                       for order_item_id in items_sting.split(',')
+                       if order_item_id.isdigit()}
+            if removed:
+                deleted_count = change_items(request.user.id,
+                                             removed=removed)[1]
+                if deleted_count:
+                    invalidate_orders([request.user.id])
                 return Response({'Status': True,
                                  'Удалено объектов': deleted_count})
         return Response({'Status': False,
                          'Errors': 'Не указаны все необходимые аргументы'})
 
-    # добавить позиции в корзину
+    # изменить количество позиций корзины, позиции с нулевым
+    # количеством удаляются
     def put(self, request, *args, **kwargs):
         items_sting = request.data.get('items')
         if items_sting:
@@ -95,57 +138,88 @@ class BasketView(APIView):
                 return Response(
                     {'Status': False, 'Errors': 'Неверный формат запроса'})
             else:
-                basket, _ = Order.objects.get_or_create(
-                    user_id=request.user.id, status='basket')
-                objects_updated = 0
+                quantities = {}
                 for order_item in items_dict:
                     if (type(order_item['id']) == int
-                            and type(order_item['quantity']) == int):
-                        objects_updated += OrderItem.objects\
-                                    .filter(order_id=basket.id,
-                                            id=order_item['id'])\
-                                    .update(quantity=order_item['quantity'])
+                            and type(order_item['quantity']) == int
+                            and 0 <= order_item['quantity'] < 2 ** 31):
+                        quantities[order_item['id']] = order_item['quantity']
+                removed = [order_item_id for order_item_id, quantity
+                           in quantities.items() if not quantity]
+                objects_updated, objects_deleted = change_items(
+                    request.user.id, quantities, removed)
+                if objects_updated or objects_deleted:
+                    invalidate_orders([request.user.id])
 
                 return Response({'Status': True,
-                                 'Обновлено объектов': objects_updated})
+                                 'Обновлено объектов': objects_updated,
+                                 'Удалено объектов': objects_deleted})
         return Response({'Status': False,
                          'Errors': 'Не указаны все необходимые аргументы'})
 
 
-class OrderView(APIView):
+class OrderHistoryMixin:
+    """
+    Постраничная история заказов с фильтрами по статусу, дате и магазину
+    """
+    serializer_class = OrderSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = OrderFilter
+    pagination_class = OrderCursorPagination
+
+    def get_page(self):
+        """
+        Собирает страницу из строк .values() в формате OrderSerializer,
+        позиции выбираются только для заказов страницы
+        """
+        rows = OrderRows(requested_fields(self.request))
+        queryset = rows.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(rows.many(rows.add_items(page)))
+
+
+class OrderView(OrderHistoryMixin, GenericAPIView):
     """
     Класс для получения и размешения заказов пользователями
     """
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        # сумма оформленного заказа хранится в заказе
+        return Order.objects\
+            .filter(user_id=self.request.user.id).exclude(status='basket')
+
     # получить мои заказы
     def get(self, request, *args, **kwargs):
-        order = Order.objects\
-            .filter(user_id=request.user.id).exclude(status='basket')\
-            .prefetch_related(
-                'ordered_items__product_info__product__category',
-                'ordered_items__product_info__product_parameters__parameter')\
-            .select_related('contact')\
-            .annotate(total_sum=Sum(F('ordered_items__quantity') *
-                                    F('ordered_items__product_info__price')))\
-            .distinct()
-
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        # 304 отдается по версиям заказов до запросов к заказам
+        etag = orders_etag(request, [user_orders_version(request.user.id)])
+        return conditional_response(request, etag, self.get_page)
 
     # разместить заказ из корзины
     def post(self, request, *args, **kwargs):
         if {'id', 'contact'}.issubset(request.data):
+            if not str(request.data['id']).isdigit() \
+                    or not str(request.data['contact']).isdigit():
+                return Response(
+                    {'Status': False, 'Errors': 'Неверный формат запроса'})
             try:
-                is_updated = Order.objects.filter(
-                    user_id=request.user.id, id=request.data['id']).update(
-                    contact_id=request.data['contact'],
-                    status='new')
+                is_updated, shortage = place_order(
+                    request.user.id, int(request.data['id']),
+                    int(request.data['contact']))
             except IntegrityError as error:
                 return Response({'Status': False,
-                                 'Errors': error})
+                                 'Errors': str(error)})
             else:
+                if shortage:
+                    return Response({'Status': False,
+                                     'Errors': 'Недостаточно товара',
+                                     'items': shortage})
                 if is_updated:
+                    invalidate_orders(
+                        [request.user.id],
+                        OrderItem.objects.filter(order_id=request.data['id'])
+                        .values_list('product_info__shop__user_id',
+                                     flat=True))
                     send_email('Обновление статуса заказа',
                                'Заказ сформирован',
                                [request.user.email])
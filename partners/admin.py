@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from partners.models import Shop
+from partners.models import Shop, ImportJob
 from products.models import ProductInfo
 
 
@@ -11,7 +11,16 @@ class ShopProductsInline(admin.TabularInline):
 
 @admin.register(Shop)
 class ShopAdmin(admin.ModelAdmin):
-    list_display = ['id', 'name', 'url', 'state', 'user']
+    list_display = ['id', 'name', 'url', 'state', 'user', 'refresh_interval',
+                    'imported_at', 'next_attempt_at']
     ordering = ['id']
     list_filter = ['state']
     inlines = [ShopProductsInline, ]
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'shop', 'status', 'rows_processed', 'rows_total',
+                    'rows_rejected', 'created_at', 'finished_at']
+    ordering = ['-created_at']
+    list_filter = ['status']
@@ -0,0 +1,74 @@
+import tracemalloc
+from json import dump as dump_json, load as load_json
+from pathlib import Path
+from time import perf_counter
+
+from django.db import transaction
+
+from partners.generator import generate_price_list
+from partners.tasks import __import_yaml
+from users.models import User
+
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'benchmarks' \
+    / 'baseline.json'
+DEFAULT_SIZES = (1000, 100000, 1000000)
+
+
+def measure(data, user_id):
+    """
+    Запускает импорт и замеряет время, число запросов и пик памяти
+    """
+    tracemalloc.start()
+    start = perf_counter()
+    stats = __import_yaml(data, user_id)
+    wall = perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'wall': round(wall, 3),
+            'queries': stats['queries'],
+            'peak_memory_mb': round(peak / 2 ** 20, 1)}
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, parameters=5):
+    """
+    Замеряет первичную загрузку и повторную загрузку без изменений
+    для прайсов каждого размера. Все изменения откатываются.
+    """
+    results = {}
+    for size in sizes:
+        data = generate_price_list(size, parameters)
+        with transaction.atomic():
+            user = User.objects.create(email=f'benchmark-{size}@localhost',
+                                       type='shop')
+            results[str(size)] = {'insert': measure(data, user.id),
+                                  'reimport': measure(data, user.id)}
+            transaction.set_rollback(True)
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not Path(path).exists():
+        return {}
+    with open(path) as file:
+        return load_json(file)
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    with open(path, 'w') as file:
+        dump_json(results, file, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+def compare(results, baseline):
+    """
+    Возвращает отношение времени к базовому замеру для каждого прогона
+    """
+    ratios = {}
+    for size, runs in results.items():
+        for run, metrics in runs.items():
+            base = baseline.get(size, {}).get(run)
+            if base and base['wall']:
+                ratios[f'{size}/{run}'] = round(
+                    metrics['wall'] / base['wall'], 2)
+    return ratios
@@ -0,0 +1,56 @@
+from random import Random
+
+from yaml import dump as dump_yaml
+
+
+CATEGORY_BASE_ID = 900000
+
+
+def generate_categories(categories=10):
+    return [{'id': CATEGORY_BASE_ID + number, 'name': f'Категория {number}'}
+            for number in range(categories)]
+
+
+def generate_goods(goods, parameters=5, categories=10, seed=0):
+    """
+    Генерирует строки прайса в формате goods по одной
+    """
+    random = Random(seed)
+    for number in range(goods):
+        price = random.randint(100, 200000)
+        yield {
+            'id': number + 1,
+            'category': CATEGORY_BASE_ID + number % categories,
+            'model': f'model/{number}',
+            'name': f'Товар {number}',
+            'price': price,
+            'price_rrc': price + random.randint(0, 5000),
+            'quantity': random.randint(0, 100),
+            'parameters': {f'Параметр {index}': random.randint(1, 1000)
+                           for index in range(parameters)},
+        }
+
+
+def generate_price_list(goods, parameters=5, categories=10, seed=0,
+                        shop='Benchmark'):
+    """
+    Возвращает синтетический прайс в виде словаря
+    """
+    return {'shop': shop,
+            'categories': generate_categories(categories),
+            'goods': list(generate_goods(goods, parameters, categories,
+                                         seed))}
+
+
+def write_price_list(file, goods, parameters=5, categories=10, seed=0,
+                     shop='Benchmark'):
+    """
+    Потоково пишет синтетический прайс в yaml, не держа его в памяти
+    """
+    options = {'allow_unicode': True, 'sort_keys': False}
+    file.write(dump_yaml({'shop': shop,
+                          'categories': generate_categories(categories)},
+                         **options))
+    file.write('goods:\n')
+    for item in generate_goods(goods, parameters, categories, seed):
+        file.write(dump_yaml([item], **options))
@@ -0,0 +1,659 @@
+import csv
+from contextlib import contextmanager
+from itertools import islice
+from tempfile import SpooledTemporaryFile
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+
+from orders.models import OrderItem
+from partners.models import Shop
+from products.cache import invalidate_catalog
+from products.catalog import refresh_catalog, refresh_categories
+from products.models import CatalogOffer, Category, ProductInfo, Product, \
+    Parameter, ProductParameter, parse_number
+
+
+def chunked(iterable, size):
+    """
+    Разбивает последовательность на списки длиной не более size
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def clean_item(item, categories):
+    """
+    Проверяет строку прайса, для некорректной строки возвращает None
+    """
+    try:
+        cleaned = {'id': int(item['id']),
+                   'category': int(item['category']),
+                   'name': str(item['name']),
+                   'model': str(item.get('model', '')),
+                   'price': int(item['price']),
+                   'price_rrc': int(item['price_rrc']),
+                   'quantity': int(item['quantity']),
+                   'parameters': dict(item.get('parameters') or {})}
+    except (KeyError, TypeError, ValueError):
+        return None
+    if (min(cleaned['id'], cleaned['price'], cleaned['price_rrc'],
+            cleaned['quantity']) < 0
+            or cleaned['category'] not in categories
+            or not cleaned['name']):
+        return None
+    return cleaned
+
+
+def unique_goods(goods, categories):
+    """
+    Оставляет одну корректную строку прайса на внешний ИД, как при
+    загрузке через COPY побеждает последняя. Некорректные строки
+    остаются, чтобы их ИД не удалили предложения магазина.
+    """
+    unique, rejected = {}, []
+    for item in goods:
+        cleaned = clean_item(item, categories)
+        if cleaned:
+            unique.pop(cleaned['id'], None)
+            unique[cleaned['id']] = item
+        else:
+            rejected.append(item)
+    return list(unique.values()) + rejected
+
+
+class QueryCounter:
+    """
+    Счетчик запросов к базе данных
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class PriceListImporter:
+    """
+    Класс для пакетной загрузки прайса поставщика
+
+    Имена категорий, товаров и параметров сопоставляются с ИД пачками,
+    предложения магазина сравниваются с уже загруженными по ключу
+    (магазин, внешний ИД): записываются только новые, измененные и
+    удаленные строки. Весь импорт магазина выполняется в одной транзакции.
+    """
+    batch_size = 1000
+    # пространство ключей рекомендательных блокировок загрузки прайсов
+    lock_namespace = 1
+    # новые предложения создаются с delisted=False, поэтому вернувшееся
+    # в прайс предложение снова выставляется на продажу
+    offer_fields = ('product_id', 'model', 'price', 'price_rrc', 'quantity',
+                    'delisted')
+
+    def __init__(self, user_id, batch_size=None, progress=None):
+        self.user_id = user_id
+        if batch_size:
+            self.batch_size = batch_size
+        self.progress = progress
+        self.parameters = {}
+        self.timings = {}
+        self.stats = {'queries': 0, 'duration': 0,
+                      'total': 0, 'processed': 0, 'rejected': 0,
+                      'categories': 0, 'products': 0,
+                      'inserted': 0, 'updated': 0, 'unchanged': 0,
+                      'removed': 0, 'parameters_inserted': 0,
+                      'parameters_updated': 0, 'parameters_removed': 0}
+
+    @contextmanager
+    def timer(self, phase):
+        """
+        Накапливает время выполнения этапа импорта
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0) \
+                + perf_counter() - start
+
+    @contextmanager
+    def measure(self):
+        """
+        Считает запросы к базе и общее время выполнения
+        """
+        counter = QueryCounter()
+        start = perf_counter()
+        with connection.execute_wrapper(counter):
+            yield
+        self.stats['queries'] += counter.count
+        self.stats['duration'] += perf_counter() - start
+
+    @contextmanager
+    def atomic(self):
+        """
+        Транзакция с замером времени фиксации
+        """
+        with transaction.atomic():
+            yield
+            commit_start = perf_counter()
+        self.timings['commit'] = self.timings.get('commit', 0) \
+            + perf_counter() - commit_start
+
+    def run(self, data):
+        self.stats['total'] = data['total'] if 'total' in data \
+            else len(data['goods'])
+        with self.measure(), self.atomic():
+            shop, categories = self.prepare(data)
+            seen = self.import_batches(shop, categories, data['goods'])
+            self.finish(shop, seen)
+        return self.report()
+
+    def lock(self):
+        """
+        Ждет завершения других загрузок прайса магазина и блокирует
+        новые до конца текущей транзакции
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)',
+                           [self.lock_namespace, self.user_id])
+
+    def prepare(self, data):
+        """
+        Загружает магазин и категории прайса
+        """
+        self.lock()
+        shop = self.import_shop(data['shop'])
+        with self.timer('categories'):
+            categories = self.import_categories(shop, data['categories'])
+        self.stats['shop'] = shop.id
+        return shop, categories
+
+    def resolve(self, categories, goods):
+        """
+        Создает недостающие товары и параметры без записи предложений
+        """
+        for batch in chunked(goods, self.batch_size):
+            batch = [item for item in (clean_item(item, categories)
+                                       for item in batch) if item]
+            with self.timer('products'):
+                self.resolve_products(batch)
+            with self.timer('parameters'):
+                self.resolve_parameters(batch)
+
+    def import_batches(self, shop, categories, goods):
+        seen = set()
+        for batch in chunked(goods, self.batch_size):
+            seen.update(self.import_goods(shop, batch, categories))
+            self.report_progress()
+        return seen
+
+    def finish(self, shop, seen):
+        """
+        Удаляет предложения, которых больше нет в прайсе, и пересобирает
+        каталог магазина для чтения
+        """
+        self.lock()
+        with self.timer('products'):
+            self.remove_stale(shop, seen)
+        with self.timer('catalog'):
+            refresh_catalog(shop_ids=[shop.id])
+        invalidate_catalog([shop.id], categories=bool(
+            self.stats['categories']))
+
+    def merge(self, stats):
+        """
+        Добавляет статистику другой части импорта
+        """
+        for key, value in stats.items():
+            if key == 'timings':
+                for phase, seconds in value.items():
+                    self.timings[phase] = self.timings.get(phase, 0) \
+                        + seconds
+            elif key != 'shop':
+                self.stats[key] = self.stats.get(key, 0) + value
+
+    def report(self):
+        stats = dict(self.stats)
+        stats['duration'] = round(stats['duration'], 3)
+        stats['timings'] = {phase: round(seconds, 3) for phase, seconds
+                            in self.timings.items()}
+        return stats
+
+    def report_progress(self):
+        if self.progress:
+            self.progress(self.stats['processed'], self.stats['total'],
+                          self.stats['rejected'])
+
+    def import_shop(self, name):
+        shop, _ = Shop.objects.get_or_create(name=name, user_id=self.user_id)
+        return shop
+
+    def import_categories(self, shop, categories):
+        names = {category['id']: category['name'] for category in categories}
+        if not names:
+            return names
+
+        existing = dict(Category.objects.filter(id__in=names)
+                        .values_list('id', 'name'))
+        missing = [Category(id=category_id, name=name)
+                   for category_id, name in names.items()
+                   if category_id not in existing]
+        changed = [Category(id=category_id, name=name)
+                   for category_id, name in names.items()
+                   if existing.get(category_id, name) != name]
+        if missing:
+            Category.objects.bulk_create(missing)
+        if changed:
+            Category.objects.bulk_update(changed, ['name'])
+            refresh_categories([category.id for category in changed])
+
+        Through = Category.shops.through
+        linked = set(Through.objects
+                     .filter(shop_id=shop.id, category_id__in=names)
+                     .values_list('category_id', flat=True))
+        if linked != names.keys():
+            Through.objects.bulk_create(
+                [Through(category_id=category_id, shop_id=shop.id)
+                 for category_id in names.keys() - linked],
+                ignore_conflicts=True)
+        self.stats['categories'] += len(missing) + len(changed)
+        return names
+
+    def resolve_products(self, goods):
+        keys = {(item['name'], item['category']) for item in goods}
+        products = {}
+        # поиск только по имени идет по индексу (name, category)
+        existing = Product.objects\
+            .filter(name__in={name for name, _ in keys})\
+            .order_by('-id')\
+            .values_list('id', 'name', 'category_id')
+        for product_id, name, category_id in existing:
+            if (name, category_id) in keys:
+                products[(name, category_id)] = product_id
+
+        missing = [Product(name=name, category_id=category_id)
+                   for name, category_id in keys - products.keys()]
+        if missing:
+            Product.objects.bulk_create(missing, batch_size=self.batch_size)
+            for product in missing:
+                products[(product.name, product.category_id)] = product.id
+            self.stats['products'] += len(missing)
+        return products
+
+    def resolve_parameters(self, goods):
+        names = {name for item in goods for name in item['parameters']}
+        names -= self.parameters.keys()
+        if not names:
+            return self.parameters
+
+        existing = Parameter.objects.filter(name__in=names)\
+            .order_by('-id').values_list('id', 'name')
+        for parameter_id, name in existing:
+            self.parameters[name] = parameter_id
+
+        missing = [Parameter(name=name)
+                   for name in names - self.parameters.keys()]
+        if missing:
+            Parameter.objects.bulk_create(missing)
+            for parameter in missing:
+                self.parameters[parameter.name] = parameter.id
+        return self.parameters
+
+    def clean_goods(self, goods, categories):
+        """
+        Отбирает корректные строки прайса и ИД предложений, которые
+        нужно сохранить в каталоге
+        """
+        valid, kept = [], set()
+        for item in goods:
+            cleaned = clean_item(item, categories)
+            if cleaned:
+                valid.append(cleaned)
+                kept.add(cleaned['id'])
+            elif isinstance(item, dict) and str(item.get('id')).isdigit():
+                # отклоненная строка не удаляет уже загруженное предложение
+                kept.add(int(item['id']))
+        self.stats['processed'] += len(goods)
+        self.stats['rejected'] += len(goods) - len(valid)
+        return valid, kept
+
+    def import_goods(self, shop, goods, categories):
+        goods, kept = self.clean_goods(goods, categories)
+        if not goods:
+            return kept
+
+        with self.timer('products'):
+            products = self.resolve_products(goods)
+        with self.timer('parameters'):
+            parameters = self.resolve_parameters(goods)
+
+        offers = {}
+        for item in goods:
+            offers[item['id']] = ProductInfo(
+                product_id=products[(item['name'], item['category'])],
+                external_id=item['id'],
+                model=item['model'],
+                price=item['price'],
+                price_rrc=item['price_rrc'],
+                quantity=item['quantity'],
+                shop_id=shop.id)
+
+        with self.timer('products'):
+            product_infos = self.import_offers(shop, offers)
+
+        with self.timer('parameters'):
+            values = {}
+            for item in goods:
+                product_info_id = product_infos[item['id']]
+                for name, value in item['parameters'].items():
+                    values[(product_info_id, parameters[name])] = str(value)
+            self.import_parameters(product_infos.values(), values)
+
+        return kept
+
+    def import_offers(self, shop, offers):
+        """
+        Записывает только новые и измененные предложения магазина
+        """
+        product_infos = {}
+        changed = []
+        existing = ProductInfo.objects\
+            .filter(shop_id=shop.id, external_id__in=offers)\
+            .order_by()\
+            .values('id', 'external_id', *self.offer_fields)
+        for row in existing:
+            offer = offers[row['external_id']]
+            offer.id = product_infos[offer.external_id] = row['id']
+            if any(getattr(offer, field) != row[field]
+                   for field in self.offer_fields):
+                changed.append(offer)
+
+        missing = [offer for external_id, offer in offers.items()
+                   if external_id not in product_infos]
+        if missing:
+            ProductInfo.objects.bulk_create(missing)
+            for offer in missing:
+                product_infos[offer.external_id] = offer.id
+        if changed:
+            ProductInfo.objects.bulk_update(changed, self.offer_fields)
+
+        self.stats['inserted'] += len(missing)
+        self.stats['updated'] += len(changed)
+        self.stats['unchanged'] += len(offers) - len(missing) - len(changed)
+        return product_infos
+
+    def import_parameters(self, product_info_ids, values):
+        """
+        Приводит параметры предложений к значениям из прайса
+        """
+        changed, stale = [], []
+        existing = ProductParameter.objects\
+            .filter(product_info_id__in=product_info_ids)\
+            .values_list('id', 'product_info_id', 'parameter_id', 'value')
+        for parameter_id, product_info_id, parameter, value in existing:
+            key = (product_info_id, parameter)
+            if key not in values:
+                stale.append(parameter_id)
+                continue
+            new_value = values.pop(key)
+            if new_value != value:
+                changed.append(ProductParameter(
+                    id=parameter_id, value=new_value,
+                    value_number=parse_number(new_value)))
+
+        if values:
+            ProductParameter.objects.bulk_create(
+                [ProductParameter(product_info_id=product_info_id,
+                                  parameter_id=parameter_id,
+                                  value=value,
+                                  value_number=parse_number(value))
+                 for (product_info_id, parameter_id), value
+                 in values.items()],
+                batch_size=self.batch_size)
+        if changed:
+            ProductParameter.objects.bulk_update(
+                changed, ['value', 'value_number'],
+                batch_size=self.batch_size)
+        if stale:
+            ProductParameter.objects.filter(id__in=stale).delete()
+
+        self.stats['parameters_inserted'] += len(values)
+        self.stats['parameters_updated'] += len(changed)
+        self.stats['parameters_removed'] += len(stale)
+
+    def remove_stale(self, shop, seen):
+        """
+        Удаляет предложения, которых больше нет в прайсе. Предложения из
+        заказов остаются для истории заказов и снимаются с продажи.
+        """
+        stale = [product_info_id for product_info_id, external_id
+                 in ProductInfo.objects.filter(shop_id=shop.id)
+                 .order_by().values_list('id', 'external_id')
+                 if external_id not in seen]
+        if not stale:
+            return
+        offers = ProductInfo.objects.filter(id__in=stale)
+        ordered = Exists(OrderItem.objects.filter(
+            product_info_id=OuterRef('pk')))
+        delisted = offers.filter(ordered, delisted=False)\
+            .update(delisted=True, quantity=0)
+        CatalogOffer.objects.filter(product_info_id__in=stale).delete()
+        deleted = offers.filter(~ordered).delete()
+        self.stats['removed'] += delisted + deleted[1].get(
+            ProductInfo._meta.label, 0)
+
+
+class CopyPriceListImporter(PriceListImporter):
+    """
+    Класс для загрузки очень больших прайсов через COPY
+
+    Строки прайса копируются во временные таблицы через COPY FROM STDIN
+    и сливаются с каталогом несколькими SQL-запросами над множествами
+    в одной транзакции. Результат совпадает с пакетной загрузкой.
+    """
+    spool_size = 16 * 2 ** 20
+    tables = {'product': Product._meta.db_table,
+              'product_info': ProductInfo._meta.db_table,
+              'parameter': Parameter._meta.db_table,
+              'product_parameter': ProductParameter._meta.db_table}
+    # таблица: (описание столбцов, столбцы COPY, столбцы без NULL)
+    stage_tables = {
+        'stage_offers': (
+            'line integer, external_id bigint, category_id bigint, '
+            'name text, model text, price bigint, price_rrc bigint, '
+            'quantity bigint, product_id bigint',
+            'line, external_id, category_id, name, model, price, '
+            'price_rrc, quantity',
+            'name, model'),
+        'stage_parameters': (
+            'line integer, external_id bigint, name text, value text, '
+            'number double precision',
+            'line, external_id, name, value, number',
+            'name, value'),
+    }
+
+    def run(self, data):
+        self.stats['total'] = data['total'] if 'total' in data \
+            else len(data['goods'])
+        with self.measure(), self.atomic(), connection.cursor() as cursor:
+            shop, categories = self.prepare(data)
+            with self.timer('products'):
+                offers, parameters, seen = self.stage(
+                    categories, data['goods'])
+                with offers:
+                    self.copy(cursor, 'stage_offers', offers)
+                self.merge_offers(cursor, shop)
+            with self.timer('parameters'):
+                with parameters:
+                    self.copy(cursor, 'stage_parameters', parameters)
+                self.merge_parameters(cursor, shop)
+            self.finish(shop, seen)
+        return self.report()
+
+    def stage(self, categories, goods):
+        """
+        Пишет корректные строки прайса в csv-файлы для COPY
+        """
+        offers = SpooledTemporaryFile(self.spool_size, 'w+', newline='')
+        parameters = SpooledTemporaryFile(self.spool_size, 'w+',
+                                          newline='')
+        offers_writer = csv.writer(offers)
+        parameters_writer = csv.writer(parameters)
+        seen = set()
+        line = 0
+        for batch in chunked(goods, self.batch_size):
+            valid, kept = self.clean_goods(batch, categories)
+            seen.update(kept)
+            for item in valid:
+                line += 1
+                offers_writer.writerow(
+                    (line, item['id'], item['category'], item['name'],
+                     item['model'], item['price'], item['price_rrc'],
+                     item['quantity']))
+                parameters_writer.writerows(
+                    (line, item['id'], name, str(value), parse_number(value))
+                    for name, value in item['parameters'].items())
+            self.report_progress()
+        offers.seek(0)
+        parameters.seek(0)
+        return offers, parameters, seen
+
+    def execute(self, cursor, sql, params=None):
+        cursor.execute(sql.format(**self.tables), params)
+        return cursor.rowcount
+
+    def copy(self, cursor, table, file):
+        columns, copied, not_null = self.stage_tables[table]
+        self.execute(cursor, f'DROP TABLE IF EXISTS {table}')
+        self.execute(cursor, f'CREATE TEMP TABLE {table} ({columns}) '
+                             f'ON COMMIT DROP')
+        cursor.copy_expert(f'COPY {table} ({copied}) FROM STDIN '
+                           f'WITH (FORMAT csv, FORCE_NOT_NULL ({not_null}))',
+                           file)
+        self.stats['queries'] += 1
+        self.execute(cursor, f'ANALYZE {table}')
+
+    def analyze(self, cursor, *tables):
+        # статистика нужна планировщику для соединений с крупными
+        # таблицами, которые могли сильно вырасти в этой же транзакции
+        self.execute(cursor, 'ANALYZE ' + ', '.join(
+            self.tables[table] for table in tables))
+
+    def merge_offers(self, cursor, shop):
+        # при повторе ИД в прайсе побеждает последняя строка
+        self.execute(cursor, """
+            DELETE FROM stage_offers s USING stage_offers d
+            WHERE s.external_id = d.external_id AND s.line < d.line""")
+
+        self.stats['products'] += self.execute(cursor, """
+            INSERT INTO {product} (name, category_id)
+            SELECT DISTINCT s.name, s.category_id FROM stage_offers s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {product} p
+                WHERE p.name = s.name AND p.category_id = s.category_id)""")
+        self.analyze(cursor, 'product', 'product_info')
+        self.execute(cursor, """
+            UPDATE stage_offers s SET product_id = p.id
+            FROM (SELECT min(id) AS id, name, category_id FROM {product}
+                  WHERE name IN (SELECT name FROM stage_offers)
+                  GROUP BY name, category_id) p
+            WHERE p.name = s.name AND p.category_id = s.category_id""")
+
+        updated = self.execute(cursor, """
+            UPDATE {product_info} i
+            SET product_id = s.product_id, model = s.model, price = s.price,
+                price_rrc = s.price_rrc, quantity = s.quantity,
+                delisted = false
+            FROM stage_offers s
+            WHERE i.shop_id = %s AND i.external_id = s.external_id
+                AND (i.product_id, i.model, i.price, i.price_rrc, i.quantity,
+                     i.delisted)
+                IS DISTINCT FROM
+                (s.product_id, s.model, s.price, s.price_rrc, s.quantity,
+                 false)
+            """, [shop.id])
+        inserted = self.execute(cursor, """
+            INSERT INTO {product_info} (product_id, shop_id, external_id,
+                                        model, price, price_rrc, quantity,
+                                        delisted)
+            SELECT s.product_id, %s, s.external_id, s.model, s.price,
+                   s.price_rrc, s.quantity, false
+            FROM stage_offers s
+            ON CONFLICT (shop_id, external_id) DO NOTHING
+            """, [shop.id])
+        self.execute(cursor, 'SELECT count(*) FROM stage_offers')
+        total = cursor.fetchone()[0]
+
+        self.stats['inserted'] += inserted
+        self.stats['updated'] += updated
+        self.stats['unchanged'] += total - inserted - updated
+
+    def merge_parameters(self, cursor, shop):
+        self.analyze(cursor, 'parameter', 'product_info',
+                     'product_parameter')
+        # остаются только параметры победившей строки предложения
+        self.execute(cursor, """
+            DELETE FROM stage_parameters p USING stage_offers s
+            WHERE p.external_id = s.external_id AND p.line <> s.line""")
+        self.execute(cursor, """
+            INSERT INTO {parameter} (name)
+            SELECT DISTINCT s.name FROM stage_parameters s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {parameter} p WHERE p.name = s.name)""")
+
+        self.execute(cursor, 'DROP TABLE IF EXISTS stage_values')
+        self.execute(cursor, """
+            CREATE TEMP TABLE stage_values ON COMMIT DROP AS
+            SELECT i.id AS product_info_id, p.id AS parameter_id, s.value,
+                s.number
+            FROM stage_parameters s
+            JOIN {product_info} i
+                ON i.shop_id = %s AND i.external_id = s.external_id
+            JOIN (SELECT min(id) AS id, name FROM {parameter}
+                  WHERE name IN (SELECT name FROM stage_parameters)
+                  GROUP BY name) p ON p.name = s.name""", [shop.id])
+        self.execute(cursor, 'ANALYZE stage_values')
+
+        updated = self.execute(cursor, """
+            UPDATE {product_parameter} pp
+            SET value = v.value, value_number = v.number
+            FROM stage_values v
+            WHERE pp.product_info_id = v.product_info_id
+                AND pp.parameter_id = v.parameter_id
+                AND pp.value <> v.value""")
+        inserted = self.execute(cursor, """
+            INSERT INTO {product_parameter} (product_info_id, parameter_id,
+                                             value, value_number)
+            SELECT v.product_info_id, v.parameter_id, v.value, v.number
+            FROM stage_values v
+            ON CONFLICT (product_info_id, parameter_id) DO NOTHING""")
+        removed = self.execute(cursor, """
+            DELETE FROM {product_parameter} pp
+            USING {product_info} i, stage_offers s
+            WHERE pp.product_info_id = i.id AND i.shop_id = %s
+                AND i.external_id = s.external_id
+                AND NOT EXISTS (
+                    SELECT 1 FROM stage_values v
+                    WHERE v.product_info_id = pp.product_info_id
+                        AND v.parameter_id = pp.parameter_id)""", [shop.id])
+
+        self.stats['parameters_inserted'] += inserted
+        self.stats['parameters_updated'] += updated
+        self.stats['parameters_removed'] += removed
+
+
+def get_importer(user_id, rows, **kwargs):
+    """
+    Выбирает способ загрузки по числу строк прайса
+    """
+    if rows >= settings.PRICE_LIST_COPY_THRESHOLD:
+        return CopyPriceListImporter(user_id, **kwargs)
+    return PriceListImporter(user_id, **kwargs)
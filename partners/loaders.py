@@ -0,0 +1,177 @@
+import csv
+from collections import namedtuple
+from hashlib import sha256
+from io import TextIOWrapper
+from json import loads as load_json
+from os.path import splitext
+from tempfile import TemporaryFile
+from urllib.parse import urlparse
+
+from requests import get
+from yaml import load as load_yaml
+
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+
+CHUNK_SIZE = 64 * 1024
+TIMEOUT = (5, 60)
+
+CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'application/jsonl': 'jsonl',
+    'application/x-jsonlines': 'jsonl',
+    'application/x-ndjson': 'jsonl',
+    'application/x-yaml': 'yaml',
+    'application/yaml': 'yaml',
+    'text/yaml': 'yaml',
+    'text/x-yaml': 'yaml',
+}
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.yaml': 'yaml',
+    '.yml': 'yaml',
+}
+# обязательные столбцы csv, остальные столбцы считаются параметрами
+CSV_FIELDS = ('shop', 'category', 'category_name', 'id', 'name', 'model',
+              'price', 'price_rrc', 'quantity')
+
+
+Download = namedtuple('Download', ('file', 'content_type', 'etag',
+                                   'last_modified', 'content_hash'))
+
+
+def download(url, etag='', last_modified=''):
+    """
+    Скачивает прайс потоково во временный файл и считает хэш содержимого.
+    При переданных валидаторах отправляет условный запрос, если прайс не
+    изменился, файл не возвращается.
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    with get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        response.raise_for_status()
+        if response.status_code == 304:
+            return Download(None, '', etag, last_modified, '')
+        file = TemporaryFile()
+        digest = sha256()
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            file.write(chunk)
+            digest.update(chunk)
+        file.seek(0)
+        return Download(file, response.headers.get('Content-Type', ''),
+                        response.headers.get('ETag', ''),
+                        response.headers.get('Last-Modified', ''),
+                        digest.hexdigest())
+
+
+def detect_format(content_type, url):
+    """
+    Определяет формат прайса по типу содержимого или расширению файла
+    """
+    content_type = content_type.split(';')[0].strip().lower()
+    if content_type in CONTENT_TYPES:
+        return CONTENT_TYPES[content_type]
+    extension = splitext(urlparse(url).path)[1].lower()
+    return EXTENSIONS.get(extension, 'yaml')
+
+
+def load_yaml_price_list(file):
+    """
+    Разбирает прайс в формате yaml через C-загрузчик libyaml
+    """
+    data = load_yaml(file, Loader=YamlLoader)
+    data['total'] = len(data['goods'])
+    return data
+
+
+def read_csv(file):
+    file.seek(0)
+    text = TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        yield from csv.DictReader(text)
+    finally:
+        text.detach()
+
+
+def csv_goods(file):
+    for row in read_csv(file):
+        yield {'id': row['id'],
+               'category': row['category'],
+               'name': row['name'],
+               'model': row['model'],
+               'price': row['price'],
+               'price_rrc': row['price_rrc'],
+               'quantity': row['quantity'],
+               'parameters': {name: value for name, value in row.items()
+                              if name not in CSV_FIELDS and value}}
+
+
+def load_csv_price_list(file):
+    """
+    Разбирает прайс в формате csv: первый проход собирает магазин и
+    категории, строки товаров читаются вторым проходом по мере загрузки
+    """
+    shop, categories, total = None, {}, 0
+    for row in read_csv(file):
+        shop = shop or row.get('shop')
+        categories.setdefault(row.get('category'), row.get('category_name'))
+        total += 1
+    return {'shop': shop,
+            'categories': [{'id': int(category_id), 'name': name}
+                           for category_id, name in categories.items()
+                           if category_id and category_id.isdigit()],
+            'goods': csv_goods(file),
+            'total': total}
+
+
+def read_lines(file):
+    file.seek(0)
+    for line in file:
+        if line.strip():
+            yield load_json(line)
+
+
+def jsonl_goods(file):
+    for row in read_lines(file):
+        if 'shop' not in row and 'categories' not in row:
+            yield row
+
+
+def load_jsonl_price_list(file):
+    """
+    Разбирает прайс в формате JSON Lines: строки с ключами shop и
+    categories описывают магазин, остальные строки - товары
+    """
+    shop, categories, total = None, [], 0
+    for row in read_lines(file):
+        if 'shop' in row or 'categories' in row:
+            shop = row.get('shop', shop)
+            categories.extend(row.get('categories', []))
+        else:
+            total += 1
+    return {'shop': shop, 'categories': categories,
+            'goods': jsonl_goods(file), 'total': total}
+
+
+LOADERS = {
+    'yaml': load_yaml_price_list,
+    'csv': load_csv_price_list,
+    'jsonl': load_jsonl_price_list,
+}
+
+
+def load_price_list(file, content_type='', url=''):
+    """
+    Разбирает прайс в формате, определенном по типу содержимого или
+    расширению. Строки товаров csv и JSON Lines читаются из файла лениво.
+    """
+    return LOADERS[detect_format(content_type, url)](file)
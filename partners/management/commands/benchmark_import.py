@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from partners.benchmark import DEFAULT_SIZES, run_benchmark, \
+    load_baseline, save_baseline, compare
+
+
+class Command(BaseCommand):
+    help = ('Замеряет скорость импорта прайса на синтетических данных '
+            'и сравнивает с базовым замером')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=list(DEFAULT_SIZES))
+        parser.add_argument('--parameters', type=int, default=5)
+        parser.add_argument('--save', action='store_true',
+                            help='Сохранить результат как базовый замер')
+        parser.add_argument('--max-slowdown', type=float, default=None,
+                            help='Ошибка, если импорт медленнее базового '
+                                 'замера больше чем в указанное число раз')
+
+    def handle(self, *args, **options):
+        results = run_benchmark(options['sizes'], options['parameters'])
+        ratios = compare(results, load_baseline())
+
+        for size, runs in results.items():
+            for run, metrics in runs.items():
+                ratio = ratios.get(f'{size}/{run}')
+                self.stdout.write(
+                    f'{size:>8} {run:<8} {metrics["wall"]:>9.3f}s '
+                    f'{metrics["queries"]:>6} queries '
+                    f'{metrics["peak_memory_mb"]:>8.1f} MB'
+                    + (f'  x{ratio} baseline' if ratio else ''))
+
+        if options['save']:
+            baseline = load_baseline()
+            baseline.update(results)
+            save_baseline(baseline)
+
+        slowdown = options['max_slowdown']
+        if slowdown and any(ratio > slowdown for ratio in ratios.values()):
+            raise CommandError('Импорт медленнее базового замера')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from partners.generator import write_price_list
+
+
+class Command(BaseCommand):
+    help = 'Генерирует синтетический прайс в формате yaml'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--goods', type=int, default=1000)
+        parser.add_argument('--parameters', type=int, default=5)
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--shop', default='Benchmark')
+
+    def handle(self, *args, **options):
+        with open(options['path'], 'w', encoding='utf-8') as file:
+            write_price_list(file, options['goods'], options['parameters'],
+                             options['categories'], options['seed'],
+                             options['shop'])
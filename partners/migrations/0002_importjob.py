@@ -0,0 +1,40 @@
+# Generated by Django 4.2.1 on 2026-10-18 20:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('partners', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('url', models.URLField(max_length=500, verbose_name='Ссылка')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('success', 'Выполнен'), ('failed', 'Ошибка')], default='pending', max_length=15, verbose_name='Статус')),
+                ('rows_total', models.PositiveIntegerField(default=0, verbose_name='Всего строк')),
+                ('rows_processed', models.PositiveIntegerField(default=0, verbose_name='Обработано строк')),
+                ('rows_rejected', models.PositiveIntegerField(default=0, verbose_name='Отклонено строк')),
+                ('timings', models.JSONField(blank=True, default=dict, verbose_name='Время этапов')),
+                ('stats', models.JSONField(blank=True, default=dict, verbose_name='Статистика')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершен')),
+                ('shop', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='import_jobs', to='partners.shop', verbose_name='Магазин')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Загрузка прайса',
+                'verbose_name_plural': 'Список загрузок прайса',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
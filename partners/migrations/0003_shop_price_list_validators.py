@@ -0,0 +1,38 @@
+# Generated by Django 4.2.1 on 2026-10-18 21:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partners', '0002_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Хэш прайса'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='etag',
+            field=models.CharField(blank=True, max_length=255, verbose_name='ETag прайса'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='last_modified',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Дата изменения прайса'),
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='status',
+            field=models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('success', 'Выполнен'), ('skipped', 'Пропущен'), ('failed', 'Ошибка')], default='pending', max_length=15, verbose_name='Статус'),
+        ),
+        migrations.AlterField(
+            model_name='shop',
+            name='url',
+            field=models.URLField(blank=True, max_length=500, null=True, verbose_name='Ссылка'),
+        ),
+    ]
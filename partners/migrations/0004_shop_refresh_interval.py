@@ -0,0 +1,23 @@
+# Generated by Django 4.2.1 on 2026-10-18 21:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partners', '0003_shop_price_list_validators'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='imported_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последняя загрузка прайса'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='refresh_interval',
+            field=models.DurationField(blank=True, null=True, verbose_name='Интервал обновления прайса'),
+        ),
+    ]
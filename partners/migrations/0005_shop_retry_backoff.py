@@ -0,0 +1,23 @@
+# Generated by Django 4.2.1 on 2026-10-18 22:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partners', '0004_shop_refresh_interval'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='failed_attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Ошибок загрузки подряд'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Следующая попытка загрузки'),
+        ),
+    ]
@@ -1,15 +1,32 @@
+from uuid import uuid4
+
 from django.db import models
+from django.utils import timezone
 
 from users.models import User
 
 
 class Shop(models.Model):
     name = models.CharField('Название', max_length=50)
-    url = models.URLField('Ссылка', null=True, blank=True)
+    url = models.URLField('Ссылка', max_length=500, null=True, blank=True)
     user = models.OneToOneField(User, verbose_name='Владелец',
                                 blank=True, null=True,
                                 on_delete=models.CASCADE)
     state = models.BooleanField('Статус получения заказов', default=True)
+    # валидаторы последнего загруженного прайса для условных запросов
+    etag = models.CharField('ETag прайса', max_length=255, blank=True)
+    last_modified = models.CharField('Дата изменения прайса', max_length=64,
+                                     blank=True)
+    content_hash = models.CharField('Хэш прайса', max_length=64, blank=True)
+    refresh_interval = models.DurationField('Интервал обновления прайса',
+                                            blank=True, null=True)
+    imported_at = models.DateTimeField('Последняя загрузка прайса',
+                                       blank=True, null=True)
+    # после ошибок загрузки периодическая загрузка откладывается
+    failed_attempts = models.PositiveSmallIntegerField(
+        'Ошибок загрузки подряд', default=0)
+    next_attempt_at = models.DateTimeField('Следующая попытка загрузки',
+                                           blank=True, null=True)
 
     class Meta:
         verbose_name = 'Магазин'
@@ -18,3 +35,73 @@ class Shop(models.Model):
 
     def __str__(self):
         return self.name
+
+
+JOB_STATUS_CHOICES = (
+    ('pending', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('success', 'Выполнен'),
+    ('skipped', 'Пропущен'),
+    ('failed', 'Ошибка'),
+)
+
+
+class ImportJob(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    user = models.ForeignKey(User, verbose_name='Пользователь',
+                             related_name='import_jobs',
+                             on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин',
+                             related_name='import_jobs',
+                             blank=True, null=True,
+                             on_delete=models.SET_NULL)
+    url = models.URLField('Ссылка', max_length=500)
+    status = models.CharField('Статус', choices=JOB_STATUS_CHOICES,
+                              max_length=15, default='pending')
+    rows_total = models.PositiveIntegerField('Всего строк', default=0)
+    rows_processed = models.PositiveIntegerField('Обработано строк',
+                                                 default=0)
+    rows_rejected = models.PositiveIntegerField('Отклонено строк',
+                                                default=0)
+    timings = models.JSONField('Время этапов', default=dict, blank=True)
+    stats = models.JSONField('Статистика', default=dict, blank=True)
+    error = models.TextField('Ошибка', blank=True)
+    created_at = models.DateTimeField('Создан', auto_now_add=True)
+    finished_at = models.DateTimeField('Завершен', blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Загрузка прайса'
+        verbose_name_plural = "Список загрузок прайса"
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'{self.url} ({self.status})'
+
+    def complete(self, stats):
+        self.status = 'success'
+        self.shop_id = stats.pop('shop', self.shop_id)
+        self.rows_total = stats['total']
+        self.rows_processed = stats['processed']
+        self.rows_rejected = stats['rejected']
+        self.timings = stats.pop('timings')
+        self.stats = stats
+        self.finished_at = timezone.now()
+        self.save()
+
+    def skip(self, shop_id, reason, timings):
+        self.status = 'skipped'
+        self.shop_id = shop_id
+        self.stats = {'reason': reason}
+        self.timings = {phase: round(seconds, 3)
+                        for phase, seconds in timings.items()}
+        self.finished_at = timezone.now()
+        self.save()
+
+    def fail(self, error, timings=None):
+        self.status = 'failed'
+        self.error = str(error)
+        if timings:
+            self.timings = {phase: round(seconds, 3)
+                            for phase, seconds in timings.items()}
+        self.finished_at = timezone.now()
+        self.save()
@@ -0,0 +1,12 @@
+from rest_framework import serializers
+
+from partners.models import ImportJob
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'url', 'shop', 'status', 'rows_total',
+                  'rows_processed', 'rows_rejected', 'timings', 'stats',
+                  'error', 'created_at', 'finished_at',)
+        read_only_fields = fields
@@ -1,8 +1,19 @@
+from datetime import timedelta
+
+from celery import chord
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Now
+from django.utils import timezone
+
 from diplom.celery import app
 
-from partners.models import Shop
-from products.models import Category, ProductInfo, Product, Parameter, \
-    ProductParameter
+from partners.importer import PriceListImporter, chunked, get_importer, \
+    unique_goods
+from partners.loaders import download, load_price_list
+from partners.models import ImportJob, Shop
+from users.models import User
 
 
 @app.task
@@ -10,36 +21,193 @@ def __import_yaml(*args):
     data = args[0]
     user_id = args[1]
 
-    shop, _ = Shop.objects.get_or_create(name=data['shop'],
-                                         user_id=user_id)
-    for category in data['categories']:
-        category_object, _ = Category.objects.get_or_create(
-            id=category['id'], name=category['name'])
-        category_object.shops.add(shop.id)
-        category_object.save()
-    ProductInfo.objects.filter(shop_id=shop.id).delete()
-    for item in data['goods']:
-        product, _ = Product.objects.get_or_create(
-            name=item['name'], category_id=item['category'])
-
-        product_info = ProductInfo.objects.create(
-            product_id=product.id,
-            external_id=item['id'],
-            model=item['model'],
-            price=item['price'],
-            price_rrc=item['price_rrc'],
-            quantity=item['quantity'],
-            shop_id=shop.id
-        )
-        for name, value in item['parameters'].items():
-            parameter_object, _ = Parameter.objects.get_or_create(
-                name=name)
-            ProductParameter.objects.create(
-                product_info_id=product_info.id,
-                parameter_id=parameter_object.id,
-                value=value
-            )
+    return get_importer(user_id, len(data['goods'])).run(data)
+
+
+@app.task(bind=True)
+def __import_price_list(self, job_id, force=False, interval=None):
+    job = ImportJob.objects.get(id=job_id)
+    job.status = 'running'
+    job.save(update_fields=['status'])
+
+    def progress(processed, total, rejected):
+        self.update_state(state='PROGRESS',
+                          meta={'rows_processed': processed,
+                                'rows_total': total,
+                                'rows_rejected': rejected})
+
+    importer = PriceListImporter(job.user_id, progress=progress)
+    shop = Shop.objects.filter(user_id=job.user_id).first()
+    # валидаторы прошлой загрузки действительны только для той же ссылки
+    known = shop if shop and shop.url == job.url and not force else None
+    try:
+        with importer.timer('fetch'):
+            fetched = download(job.url, *(
+                (known.etag, known.last_modified) if known else ()))
+        source = {'url': job.url, 'interval': interval}
+        if fetched.file is None:
+            save_source(known.id, source)
+            job.skip(known.id, 'not_modified', importer.timings)
+            return
+        source.update(etag=fetched.etag, last_modified=fetched.last_modified,
+                      content_hash=fetched.content_hash)
+        with fetched.file as file:
+            if known and fetched.content_hash == known.content_hash:
+                save_source(known.id, source)
+                job.skip(known.id, 'unchanged', importer.timings)
+                return
+            with importer.timer('parse'):
+                data = load_price_list(file, fetched.content_type, job.url)
+            rows = data['total']
+            if settings.PRICE_LIST_CHUNK_SIZE < rows \
+                    < settings.PRICE_LIST_COPY_THRESHOLD:
+                return import_in_parallel(job, importer, data, source)
+            timings = importer.timings
+            importer = get_importer(job.user_id, rows, progress=progress)
+            importer.merge({'timings': timings})
+            stats = importer.run(data)
+    except Exception as error:
+        job.fail(error, importer.timings)
+        save_failure(job.user_id)
+        raise
+
+    save_source(stats['shop'], source)
+    job.complete(stats)
+    return stats
+
+
+@app.task
+def __import_chunk(job_id, shop_id, categories, goods):
+    job = ImportJob.objects.get(id=job_id)
+    shop = Shop.objects.get(id=shop_id)
+    importer = PriceListImporter(job.user_id)
+    with importer.measure(), importer.atomic():
+        kept = importer.import_batches(shop, set(categories), goods)
+
+    ImportJob.objects.filter(id=job_id).update(
+        rows_processed=F('rows_processed') + importer.stats['processed'],
+        rows_rejected=F('rows_rejected') + importer.stats['rejected'])
+    return {'kept': list(kept), 'stats': importer.report()}
+
+
+@app.task
+def __finish_import(results, job_id, shop_id, stats, source):
+    job = ImportJob.objects.get(id=job_id)
+    shop = Shop.objects.get(id=shop_id)
+    importer = PriceListImporter(job.user_id)
+    importer.merge(stats)
+    seen = set()
+    for result in results:
+        importer.merge(result['stats'])
+        seen.update(result['kept'])
+
+    with importer.measure(), importer.atomic():
+        importer.finish(shop, seen)
+
+    stats = importer.report()
+    stats['shop'] = shop_id
+    save_source(shop_id, source)
+    job.complete(stats)
+    return stats
+
+
+@app.task
+def __fail_import(request, exc, traceback, job_id):
+    job = ImportJob.objects.get(id=job_id)
+    job.fail(exc)
+    save_failure(job.user_id)
+
+
+@app.task
+def __refresh_price_lists():
+    shops = Shop.objects.filter(user__isnull=False, url__isnull=False,
+                                refresh_interval__isnull=False)\
+        .filter(Q(imported_at__isnull=True)
+                | Q(imported_at__lte=Now() - F('refresh_interval')))\
+        .filter(Q(next_attempt_at__isnull=True)
+                | Q(next_attempt_at__lte=Now()))\
+        .exclude(url='')
+    for shop in shops:
+        import_price_list(shop.url, shop.user_id)
+    return len(shops)
+
+
+def save_source(shop_id, source):
+    """
+    Запоминает ссылку, валидаторы и время загрузки прайса магазина
+    """
+    source = dict(source)
+    interval = source.pop('interval', None)
+    if interval is not None:
+        source['refresh_interval'] = timedelta(minutes=interval) \
+            if interval else None
+    Shop.objects.filter(id=shop_id).update(imported_at=timezone.now(),
+                                           failed_attempts=0,
+                                           next_attempt_at=None, **source)
+
+
+def save_failure(user_id):
+    """
+    Откладывает следующую периодическую загрузку прайса магазина после
+    ошибки, пауза удваивается с каждой ошибкой подряд
+    """
+    shop = Shop.objects.filter(user_id=user_id).first()
+    if shop is None:
+        return
+    attempts = shop.failed_attempts + 1
+    delay = min(settings.PRICE_LIST_RETRY_DELAY * 2 ** (attempts - 1),
+                settings.PRICE_LIST_RETRY_MAX_DELAY)
+    Shop.objects.filter(id=shop.id).update(
+        failed_attempts=attempts,
+        next_attempt_at=timezone.now() + timedelta(seconds=delay))
+
+
+def import_in_parallel(job, importer, data, source):
+    """
+    Раскладывает большой прайс на части для параллельной загрузки:
+    товары и параметры создаются заранее, части пишут только предложения,
+    а завершающая задача удаляет устаревшие предложения магазина
+    """
+    importer.stats['total'] = data['total']
+    with importer.measure(), importer.atomic():
+        shop, categories = importer.prepare(data)
+        # части не видят друг друга, повтор ИД в двух частях привел бы
+        # к двум вставкам одного предложения
+        goods = unique_goods(data['goods'], categories)
+        importer.stats['processed'] += data['total'] - len(goods)
+        importer.resolve(categories, goods)
+
+    job.shop_id = shop.id
+    job.rows_total = data['total']
+    job.save(update_fields=['shop', 'rows_total'])
+
+    job_id = str(job.id)
+    header = [__import_chunk.s(job_id, shop.id, list(categories), chunk)
+              for chunk in chunked(goods, settings.PRICE_LIST_CHUNK_SIZE)]
+    callback = __finish_import.s(job_id, shop.id, importer.report(), source)\
+        .on_error(__fail_import.s(job_id))
+    chord(header)(callback)
 
 
 def import_yaml(data, user_id):
     __import_yaml.delay(data, user_id)
+
+
+def import_price_list(url, user_id, force=False, interval=None):
+    """
+    Ставит загрузку прайса в очередь. Пока загрузка той же ссылки для
+    магазина не завершена, повторные запросы возвращают ее задачу.
+    """
+    with transaction.atomic():
+        # блокировка пользователя упорядочивает запросы одного магазина
+        User.objects.select_for_update().get(id=user_id)
+        job = ImportJob.objects.filter(
+            user_id=user_id, url=url, status__in=('pending', 'running'),
+            created_at__gte=timezone.now() - timedelta(
+                seconds=settings.PRICE_LIST_JOB_TIMEOUT)).first()
+        if job:
+            return job
+        job = ImportJob.objects.create(url=url, user_id=user_id)
+    __import_price_list.apply_async((str(job.id), force, interval),
+                                    task_id=str(job.id))
+    return job
@@ -1,12 +1,30 @@
+import json
+import logging
+from datetime import timedelta
+from email.utils import formatdate
+from hashlib import md5
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
 import pytest
+import yaml
 from django.urls import reverse
+from django.utils import timezone
 from model_bakery import baker
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 
+from diplom.celery import app
+from partners.benchmark import run_benchmark
+from partners.generator import write_price_list, generate_price_list
 from orders.models import Order, OrderItem
-from partners.models import Shop
-from products.models import ProductInfo, Product, Category
+from partners.importer import PriceListImporter, CopyPriceListImporter
+from partners.models import Shop, ImportJob
+from partners import tasks
+from partners.tasks import __refresh_price_lists as refresh_price_lists
+from products.models import ProductInfo, Product, Category, \
+    ProductParameter
+from products.serializers import ProductInfoSerializer
 from users.models import User, Contact
 
 
@@ -52,19 +70,611 @@ def order_factory():
     return factory
 
 
+@pytest.fixture
+def price_list_factory():
+    def factory(goods_count, shop='Связной', *args, **kwargs):
+        return {
+            'shop': shop,
+            'categories': [{'id': 224, 'name': 'Смартфоны'},
+                           {'id': 15, 'name': 'Аксессуары'}],
+            'goods': [{'id': 1000 + number,
+                       'category': 224 if number % 2 else 15,
+                       'model': f'apple/iphone/{number}',
+                       'name': f'Смартфон Apple iPhone {number}',
+                       'price': 100 + number,
+                       'price_rrc': 200 + number,
+                       'quantity': number,
+                       'parameters': {'Диагональ (дюйм)': 6.5,
+                                      'Цвет': f'цвет {number}'}}
+                      for number in range(goods_count)],
+        }
+
+    return factory
+
+
+@pytest.fixture
+def celery_eager():
+    app.conf.task_always_eager = True
+    yield
+    app.conf.task_always_eager = False
+
+
+@pytest.fixture
+def price_server():
+    """Local HTTP stand-in for partner price list hosting"""
+    files = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in files:
+                self.send_response(404)
+                self.end_headers()
+                return
+            body, content_type, validators = files[self.path]
+            publish.requests.append(dict(self.headers))
+            if validators and self.headers.get('If-None-Match') \
+                    == validators['ETag']:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in validators.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    def publish(path, data, content_type='application/x-yaml',
+                validators=True):
+        if not isinstance(data, bytes):
+            data = yaml.dump(data, allow_unicode=True).encode()
+        if validators:
+            validators = {'ETag': f'"{md5(data).hexdigest()}"',
+                          'Last-Modified': formatdate(usegmt=True)}
+        files[path] = data, content_type, validators or {}
+        return f'http://127.0.0.1:{server.server_port}{path}'
+
+    publish.requests = []
+    yield publish
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.django_db
+def test_import_price_list(user_factory, price_list_factory):
+    """Bulk import of price list test"""
+    user, header_auth = user_factory()
+    data = price_list_factory(20)
+
+    stats = PriceListImporter(user.id).run(data)
+
+    shop = Shop.objects.get(user_id=user.id)
+    assert stats['inserted'] == 20
+    assert ProductInfo.objects.filter(shop_id=shop.id).count() == 20
+    assert ProductParameter.objects\
+        .filter(product_info__shop_id=shop.id).count() == 40
+    assert set(Category.objects.filter(shops=shop)
+               .values_list('id', flat=True)) == {224, 15}
+    assert set(ProductParameter.objects
+               .filter(product_info__shop_id=shop.id,
+                       parameter__name='Диагональ (дюйм)')
+               .values_list('value_number', flat=True)) == {6.5}
+
+    data['goods'] = data['goods'][5:]
+    data['goods'][0]['price'] = 1
+    stats = PriceListImporter(user.id).run(data)
+
+    assert stats['removed'] == 5
+    assert ProductInfo.objects.filter(shop_id=shop.id).count() == 15
+    assert ProductInfo.objects.get(shop_id=shop.id, external_id=1005)\
+        .price == 1
+
+
+@pytest.mark.django_db
+def test_import_price_list_diff(user_factory, price_list_factory):
+    """Differential import touches only changed offers test"""
+    user, header_auth = user_factory()
+    data = price_list_factory(10)
+    PriceListImporter(user.id).run(data)
+    shop = Shop.objects.get(user_id=user.id)
+    product_info = ProductInfo.objects.get(shop_id=shop.id, external_id=1003)
+    order = baker.make(Order, status='new', user_id=user.id)
+    OrderItem.objects.create(order_id=order.id,
+                             product_info_id=product_info.id, quantity=1)
+
+    stats = PriceListImporter(user.id).run(data)
+
+    assert stats['unchanged'] == 10
+    for key in ('inserted', 'updated', 'removed', 'parameters_inserted',
+                'parameters_updated', 'parameters_removed'):
+        assert stats[key] == 0
+
+    data['goods'][3]['price'] = 1
+    data['goods'][3]['parameters']['Цвет'] = 'черный'
+    data['goods'].append(dict(data['goods'][0], id=5000))
+    stats = PriceListImporter(user.id).run(data)
+
+    assert stats['inserted'] == 1
+    assert stats['updated'] == 1
+    assert stats['parameters_updated'] == 1
+    assert ProductInfo.objects.get(id=product_info.id).price == 1
+    assert OrderItem.objects.filter(product_info_id=product_info.id).exists()
+
+
+@pytest.mark.django_db
+def test_import_price_list_cache(client, user_factory, price_list_factory,
+                                 django_capture_on_commit_callbacks):
+    """Price list import and shop state invalidate catalog cache test"""
+    user, header_auth = user_factory()
+    data = price_list_factory(2)
+    with django_capture_on_commit_callbacks(execute=True):
+        PriceListImporter(user.id).run(data)
+    shop = Shop.objects.get(user_id=user.id)
+
+    def prices():
+        response = client.get(reverse('products'), data={'shop_id': shop.id})
+        return sorted(item['price'] for item in response.json()['results'])
+
+    def shops():
+        response = client.get(reverse('product_shops'))
+        return [item['id'] for item in response.json()['results']]
+
+    assert prices() == [100, 101]
+    assert shops() == [shop.id]
+
+    data['goods'][0]['price'] = 150
+    with django_capture_on_commit_callbacks(execute=True):
+        CopyPriceListImporter(user.id).run(data)
+    assert prices() == [101, 150]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        client.post(reverse('partner_state'), data={'state': 'off'},
+                    headers=header_auth)
+    assert shops() == []
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('importer_class',
+                         [PriceListImporter, CopyPriceListImporter])
+def test_import_price_list_catalog(client, user_factory, price_list_factory,
+                                   importer_class,
+                                   django_capture_on_commit_callbacks):
+    """Price list import rebuilds the catalog read model test"""
+    user, header_auth = user_factory()
+    data = price_list_factory(6)
+
+    def catalog():
+        response = client.get(reverse('products'),
+                              data={'page_size': 100})
+        return sorted(response.json()['results'], key=lambda item: item['id'])
+
+    def expected():
+        offers = ProductInfo.objects.filter(shop__user_id=user.id)\
+            .order_by('id')
+        return [dict(item) for item in
+                ProductInfoSerializer(offers, many=True).data]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        importer_class(user.id).run(data)
+    assert catalog() == expected()
+    assert len(catalog()) == 6
+
+    data['goods'] = data['goods'][2:]
+    data['goods'][0]['parameters'] = {'Цвет': 'черный'}
+    data['categories'][0]['name'] = 'Телефоны'
+    with django_capture_on_commit_callbacks(execute=True):
+        importer_class(user.id).run(data)
+    assert catalog() == expected()
+    assert len(catalog()) == 4
+    assert {item['product']['category'] for item in catalog()} == \
+        {'Телефоны', 'Аксессуары'}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('importer_class',
+                         [PriceListImporter, CopyPriceListImporter])
+def test_import_price_list_ordered_offer(client, user_factory,
+                                         price_list_factory, importer_class,
+                                         django_capture_on_commit_callbacks):
+    """Offers removed from the price list survive in placed orders test"""
+    user, header_auth = user_factory()
+    data = price_list_factory(3)
+    importer_class(user.id).run(data)
+    shop = Shop.objects.get(user_id=user.id)
+    offer = ProductInfo.objects.get(shop_id=shop.id, external_id=1001)
+    order = baker.make(Order, status='new', user_id=user.id)
+    OrderItem.objects.create(order=order, product_info=offer, quantity=2)
+    order.refresh_from_db()
+    total_sum = order.total_sum
+
+    data['goods'] = [item for item in data['goods'] if item['id'] != 1001]
+    stats = importer_class(user.id).run(data)
+
+    assert stats['removed'] == 1
+    assert order.ordered_items.count() == 1
+    order.refresh_from_db()
+    assert order.total_sum == total_sum == 2 * 101
+    offer.refresh_from_db()
+    assert offer.delisted and offer.quantity == 0
+    response = client.get(reverse('products'), data={'shop_id': shop.id})
+    assert offer.id not in [item['id'] for item in response.json()['results']]
+    response = client.post(reverse('order_basket'), data={'items': json.dumps(
+        [{'product_info': offer.id, 'quantity': 1}])}, headers=header_auth)
+    assert response.json()['Создано объектов'] == 0
+
+    assert importer_class(user.id).run(data)['removed'] == 0
+    data['goods'].append(price_list_factory(3)['goods'][1])
+    with django_capture_on_commit_callbacks(execute=True):
+        importer_class(user.id).run(data)
+    offer.refresh_from_db()
+    assert not offer.delisted and offer.quantity == 1
+    response = client.get(reverse('products'), data={'shop_id': shop.id})
+    assert offer.id in [item['id'] for item in response.json()['results']]
+
+
+@pytest.mark.django_db
+def test_import_price_list_copy(user_factory, price_list_factory):
+    """COPY import gives the same catalog as batched import test"""
+    user, header_auth = user_factory()
+    data = price_list_factory(20)
+    PriceListImporter(user.id).run(data)
+    shop = Shop.objects.get(user_id=user.id)
+    offers = ProductInfo.objects.filter(shop_id=shop.id)
+    expected = set(offers.values_list('id', 'external_id', 'price',
+                                      'product__name'))
+
+    stats = CopyPriceListImporter(user.id).run(data)
+
+    assert stats['unchanged'] == 20
+    assert stats['parameters_inserted'] == 0
+    assert set(offers.values_list('id', 'external_id', 'price',
+                                  'product__name')) == expected
+
+    data['goods'] = data['goods'][2:]
+    data['goods'][0]['price'] = 1
+    data['goods'][0]['parameters'] = {'Цвет': 'черный', 'Вес': 10}
+    data['goods'].append(dict(data['goods'][1], id=5000))
+    stats = CopyPriceListImporter(user.id).run(data)
+
+    assert stats['inserted'] == 1
+    assert stats['updated'] == 1
+    assert stats['removed'] == 2
+    assert stats['parameters_inserted'] == 3
+    assert stats['parameters_updated'] == 1
+    assert stats['parameters_removed'] == 1
+    assert offers.get(external_id=1002).price == 1
+    assert dict(ProductParameter.objects
+                .filter(product_info__external_id=1002,
+                        product_info__shop_id=shop.id)
+                .values_list('parameter__name', 'value')) == \
+        {'Цвет': 'черный', 'Вес': '10'}
+    assert dict(ProductParameter.objects
+                .filter(product_info__external_id=1002,
+                        product_info__shop_id=shop.id)
+                .values_list('parameter__name', 'value_number')) == \
+        {'Цвет': None, 'Вес': 10}
+
+
+@pytest.mark.django_db
+def test_import_price_list_query_count(user_factory, price_list_factory):
+    """Query count of price list import does not depend on size test"""
+    user, header_auth = user_factory()
+    small = PriceListImporter(user.id).run(price_list_factory(10, 'Small'))
+
+    user, header_auth = user_factory()
+    large = PriceListImporter(user.id).run(price_list_factory(300, 'Large'))
+
+    assert large['queries'] <= small['queries']
+
+
+def test_generate_price_list(tmp_path):
+    """Synthetic price list generator test"""
+    path = tmp_path / 'shop.yaml'
+    with open(path, 'w', encoding='utf-8') as file:
+        write_price_list(file, 30, parameters=3)
+
+    with open(path, encoding='utf-8') as file:
+        data = yaml.safe_load(file)
+    assert data == generate_price_list(30, parameters=3)
+    assert len(data['goods']) == 30
+    assert len(data['goods'][0]['parameters']) == 3
+
+
 @pytest.mark.django_db
-def test_partner_update_price(client, user_factory):
+def test_import_benchmark():
+    """Import benchmark harness test"""
+    results = run_benchmark([50], parameters=2)
+
+    assert results['50']['insert']['queries'] > 0
+    assert results['50']['reimport']['peak_memory_mb'] >= 0
+    assert not ProductInfo.objects.exists()
+
+
+@pytest.mark.django_db
+def test_partner_update_price(client, user_factory, celery_eager,
+                              price_server, price_list_factory):
     """Partner update price test"""
     user, header_auth = user_factory()
+    url_yaml = price_server('/shop1.yaml', price_list_factory(5))
 
     url = reverse('partner_update')
-    url_yaml = ('https://raw.githubusercontent.com/netology-code/python-final-'
-                'diplom/a7371c6536107f6360fe54c4fc95be15f7d19d60/data/'
-                'shop1.yaml')
     response = client.post(url, data={'url': url_yaml}, headers=header_auth)
 
     data = response.json()
     assert data['Status']
+    assert data['job_id']
+    assert ProductInfo.objects.filter(shop__user_id=user.id).count() == 5
+
+
+@pytest.mark.django_db
+def test_partner_update_price_csv(client, user_factory, celery_eager,
+                                  price_server):
+    """Partner update price from csv file test"""
+    user, header_auth = user_factory()
+    body = ('shop,category,category_name,id,name,model,price,price_rrc,'
+            'quantity,Цвет,Диагональ (дюйм)\n'
+            'Связной,224,Смартфоны,1,Смартфон 1,m1,100,120,3,черный,6.5\n'
+            'Связной,15,Аксессуары,2,Чехол 2,m2,10,12,5,красный,\n'
+            'Связной,15,Аксессуары,3,Чехол 3,m3,дорого,12,5,,\n')
+    url_csv = price_server('/shop1.csv', body.encode(), 'text/csv')
+
+    response = client.post(reverse('partner_update'), data={'url': url_csv},
+                           headers=header_auth)
+
+    job = ImportJob.objects.get(id=response.json()['job_id'])
+    assert job.status == 'success'
+    assert job.rows_total == 3
+    assert job.rows_rejected == 1
+    assert set(Category.objects.filter(shops__user_id=user.id)
+               .values_list('name', flat=True)) == {'Смартфоны', 'Аксессуары'}
+    offer = ProductInfo.objects.get(shop__user_id=user.id, external_id=2)
+    assert offer.price == 10
+    assert dict(offer.product_parameters.values_list(
+        'parameter__name', 'value')) == {'Цвет': 'красный'}
+
+
+@pytest.mark.django_db
+def test_partner_update_price_jsonl(client, user_factory, celery_eager,
+                                    price_server, price_list_factory):
+    """Partner update price from JSON Lines file test"""
+    user, header_auth = user_factory()
+    price_list = price_list_factory(5)
+    lines = [{'shop': price_list['shop'],
+              'categories': price_list['categories']}] + price_list['goods']
+    body = '\n'.join(json.dumps(line, ensure_ascii=False) for line in lines)
+    url_jsonl = price_server('/shop1.jsonl', body.encode(),
+                             'application/octet-stream')
+
+    response = client.post(reverse('partner_update'),
+                           data={'url': url_jsonl}, headers=header_auth)
+
+    job = ImportJob.objects.get(id=response.json()['job_id'])
+    assert job.status == 'success'
+    assert job.rows_total == 5
+    assert ProductInfo.objects.filter(shop__user_id=user.id).count() == 5
+
+
+@pytest.mark.django_db
+def test_partner_update_price_not_modified(client, user_factory,
+                                           celery_eager, price_server,
+                                           price_list_factory):
+    """Skip price list import on 304 Not Modified test"""
+    user, header_auth = user_factory()
+    url_yaml = price_server('/shop1.yaml', price_list_factory(5))
+    url = reverse('partner_update')
+    client.post(url, data={'url': url_yaml}, headers=header_auth)
+    ProductInfo.objects.filter(shop__user_id=user.id).update(quantity=0)
+
+    response = client.post(url, data={'url': url_yaml}, headers=header_auth)
+
+    job = ImportJob.objects.get(id=response.json()['job_id'])
+    assert job.status == 'skipped'
+    assert job.stats == {'reason': 'not_modified'}
+    assert job.shop == Shop.objects.get(user_id=user.id)
+    assert price_server.requests[-1]['If-None-Match'] == \
+        Shop.objects.get(user_id=user.id).etag
+    assert not ProductInfo.objects.filter(shop__user_id=user.id,
+                                          quantity__gt=0).exists()
+
+
+@pytest.mark.django_db
+def test_partner_update_price_unchanged(client, user_factory, celery_eager,
+                                        price_server, price_list_factory):
+    """Skip price list import with the same content hash test"""
+    user, header_auth = user_factory()
+    url_yaml = price_server('/shop1.yaml', price_list_factory(5),
+                            validators=False)
+    url = reverse('partner_update')
+    client.post(url, data={'url': url_yaml}, headers=header_auth)
+
+    response = client.post(url, data={'url': url_yaml}, headers=header_auth)
+    job = ImportJob.objects.get(id=response.json()['job_id'])
+    assert job.status == 'skipped'
+    assert job.stats == {'reason': 'unchanged'}
+
+    response = client.post(url, data={'url': url_yaml, 'force': 'true'},
+                           headers=header_auth)
+    job = ImportJob.objects.get(id=response.json()['job_id'])
+    assert job.status == 'success'
+
+    price_server('/shop1.yaml', price_list_factory(6), validators=False)
+    response = client.post(url, data={'url': url_yaml}, headers=header_auth)
+    job = ImportJob.objects.get(id=response.json()['job_id'])
+    assert job.status == 'success'
+    assert job.stats['inserted'] == 1
+
+
+@pytest.mark.django_db
+def test_partner_update_price_coalesce(client, user_factory, celery_eager,
+                                       price_server, price_list_factory):
+    """Collapse duplicate price list imports into the running one test"""
+    user, header_auth = user_factory()
+    url_yaml = price_server('/shop1.yaml', price_list_factory(5))
+    running = baker.make(ImportJob, user=user, url=url_yaml,
+                         status='running')
+
+    response = client.post(reverse('partner_update'),
+                           data={'url': url_yaml}, headers=header_auth)
+
+    assert response.json()['job_id'] == str(running.id)
+    assert ImportJob.objects.filter(user=user).count() == 1
+    assert not ProductInfo.objects.filter(shop__user_id=user.id).exists()
+
+
+@pytest.mark.django_db
+def test_refresh_price_lists(client, user_factory, celery_eager,
+                             price_server, price_list_factory):
+    """Scheduled price list refresh test"""
+    user, header_auth = user_factory()
+    url_yaml = price_server('/shop1.yaml', price_list_factory(5))
+    client.post(reverse('partner_update'),
+                data={'url': url_yaml, 'interval': 60}, headers=header_auth)
+    shop = Shop.objects.get(user_id=user.id)
+    assert shop.url == url_yaml
+    assert shop.refresh_interval == timedelta(minutes=60)
+
+    assert refresh_price_lists() == 0
+
+    shop.imported_at = timezone.now() - timedelta(minutes=61)
+    shop.save()
+    assert refresh_price_lists() == 1
+    job = ImportJob.objects.filter(user=user).first()
+    assert job.status == 'skipped'
+    shop.refresh_from_db()
+    assert shop.imported_at > timezone.now() - timedelta(minutes=1)
+
+
+@pytest.mark.django_db
+def test_refresh_price_lists_backoff(client, user_factory, celery_eager,
+                                     price_server, price_list_factory,
+                                     settings, monkeypatch):
+    """Failed scheduled refresh is retried with growing delay test"""
+    settings.PRICE_LIST_RETRY_DELAY = 300
+    # журнал ошибки задачи в режиме eager не форматирует трассировку
+    # billiard под перехватом логов pytest
+    monkeypatch.setattr(logging.getLogger('celery.app.trace'),
+                        'disabled', True)
+    user, header_auth = user_factory()
+    url_yaml = price_server('/shop1.yaml', price_list_factory(5))
+    client.post(reverse('partner_update'),
+                data={'url': url_yaml, 'interval': 60}, headers=header_auth)
+    shop = Shop.objects.get(user_id=user.id)
+    Shop.objects.filter(id=shop.id).update(
+        url=url_yaml.replace('shop1', 'missing'),
+        imported_at=timezone.now() - timedelta(minutes=61))
+
+    assert refresh_price_lists() == 1
+    assert refresh_price_lists() == 0
+    assert ImportJob.objects.filter(user=user, status='failed').count() == 1
+    shop.refresh_from_db()
+    assert shop.failed_attempts == 1
+    delay = shop.next_attempt_at - timezone.now()
+    assert timedelta(seconds=290) < delay <= timedelta(seconds=300)
+
+    Shop.objects.filter(id=shop.id).update(next_attempt_at=timezone.now())
+    assert refresh_price_lists() == 1
+    shop.refresh_from_db()
+    assert shop.failed_attempts == 2
+    assert shop.next_attempt_at - timezone.now() > timedelta(seconds=590)
+
+    Shop.objects.filter(id=shop.id).update(url=url_yaml,
+                                           next_attempt_at=timezone.now())
+    assert refresh_price_lists() == 1
+    shop.refresh_from_db()
+    assert shop.failed_attempts == 0
+    assert shop.next_attempt_at is None
+
+
+@pytest.mark.django_db
+def test_partner_update_status(client, user_factory, celery_eager,
+                               price_server, price_list_factory):
+    """Get price list import job status test"""
+    user, header_auth = user_factory()
+    price_list = price_list_factory(5)
+    price_list['goods'][0]['price'] = 'дорого'
+    url_yaml = price_server('/shop1.yaml', price_list)
+    response = client.post(reverse('partner_update'), data={'url': url_yaml},
+                           headers=header_auth)
+    job_id = response.json()['job_id']
+
+    url = reverse('partner_update_status', args=[job_id])
+    response = client.get(url, headers=header_auth)
+
+    data = response.json()
+    assert data['status'] == 'success'
+    assert data['rows_total'] == 5
+    assert data['rows_processed'] == 5
+    assert data['rows_rejected'] == 1
+    assert {'fetch', 'parse', 'categories', 'products', 'parameters',
+            'commit'} <= data['timings'].keys()
+
+
+@pytest.mark.django_db
+def test_partner_update_price_parallel(client, user_factory, celery_eager,
+                                       price_server, price_list_factory,
+                                       settings):
+    """Large price list is imported in parallel chunks test"""
+    settings.PRICE_LIST_CHUNK_SIZE = 4
+    user, header_auth = user_factory()
+    price_list = price_list_factory(10)
+    client.post(reverse('partner_update'),
+                data={'url': price_server('/shop1.yaml', price_list)},
+                headers=header_auth)
+
+    price_list['goods'] = price_list['goods'][:9]
+    response = client.post(reverse('partner_update'),
+                           data={'url': price_server('/shop1.yaml',
+                                                     price_list)},
+                           headers=header_auth)
+
+    job = ImportJob.objects.get(id=response.json()['job_id'])
+    assert job.status == 'success'
+    assert job.rows_processed == 9
+    assert job.stats['unchanged'] == 9
+    assert job.stats['removed'] == 1
+    assert ProductInfo.objects.filter(shop__user_id=user.id).count() == 9
+
+
+@pytest.mark.django_db
+def test_partner_update_price_parallel_duplicates(client, user_factory,
+                                                  celery_eager, price_server,
+                                                  price_list_factory,
+                                                  settings, monkeypatch):
+    """Repeated offer id across parallel chunks is written once test"""
+    settings.PRICE_LIST_CHUNK_SIZE = 4
+    user, header_auth = user_factory()
+    price_list = price_list_factory(6)
+    # повтор первой строки попадает во вторую часть, побеждает последняя
+    price_list['goods'].insert(5, dict(price_list['goods'][0], price=999))
+    chunks = []
+
+    def chord(header):
+        chunks.extend(task.args[3] for task in header)
+        return tasks.chord(header)
+
+    monkeypatch.setattr('partners.tasks.chord', chord)
+    response = client.post(reverse('partner_update'),
+                           data={'url': price_server('/shop1.yaml',
+                                                     price_list)},
+                           headers=header_auth)
+
+    ids = [item['id'] for chunk in chunks for item in chunk]
+    assert len(chunks) == 2
+    assert sorted(ids) == sorted(set(ids))
+    job = ImportJob.objects.get(id=response.json()['job_id'])
+    assert job.status == 'success'
+    assert job.rows_processed == 7
+    assert job.stats['inserted'] == 6
+    assert job.stats['updated'] == 0
+    assert ProductInfo.objects.get(shop__user_id=user.id,
+                                   external_id=1000).price == 999
 
 
 @pytest.mark.django_db
@@ -105,4 +715,4 @@ def test_get_shop_orders(client, user_factory, shop_factory, order_factory):
     response = client.get(url, headers=header_auth)
 
     data = response.json()
-    assert data[0]['status'] == 'new'
+    assert data['results'][0]['status'] == 'new'
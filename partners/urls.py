@@ -1,9 +1,12 @@
 from django.urls import path
 
-from partners.views import PartnerUpdate, PartnerState, PartnerOrders
+from partners.views import PartnerUpdate, PartnerUpdateStatus, \
+    PartnerState, PartnerOrders
 
 urlpatterns = [
     path('update', PartnerUpdate.as_view(), name='partner_update'),
+    path('update/<uuid:job_id>', PartnerUpdateStatus.as_view(),
+         name='partner_update_status'),
     path('state', PartnerState.as_view(), name='partner_state'),
     path('orders', PartnerOrders.as_view(), name='partner_orders'),
 ]
@@ -1,17 +1,21 @@
+from celery.result import AsyncResult
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
-from django.db.models import Sum, F
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from rest_framework.generics import GenericAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from distutils.util import strtobool
-from yaml import load as load_yaml, Loader
-from requests import get
 
-from orders.models import Order
-from orders.serializers import OrderSerializer
-from partners.models import Shop
-from partners.tasks import import_yaml
+from orders.models import Order, OrderItem
+from orders.cache import orders_etag, partner_orders_version
+from orders.views import OrderHistoryMixin
+from partners.models import Shop, ImportJob
+from partners.serializers import ImportJobSerializer
+from partners.tasks import import_price_list
+from products.cache import invalidate_catalog, conditional_response
 from products.serializers import ShopSerializer
 
 
@@ -32,18 +36,53 @@ class PartnerUpdate(APIView):
             validate_url = URLValidator()
             try:
                 validate_url(url)
-            except ValidationError as e:
+                # force - загрузить прайс, даже если он не изменился
+                force = strtobool(str(request.data.get('force', 'false')))
+                # interval - интервал автообновления в минутах, 0 - отключить
+                interval = request.data.get('interval')
+                if interval is not None:
+                    interval = int(interval)
+                    if interval < 0:
+                        raise ValueError('Интервал не может быть '
+                                         'отрицательным')
+            except (ValidationError, ValueError) as e:
                 return Response({'Status': False, 'Error': str(e)})
             else:
-                stream = get(url).content
-                data = load_yaml(stream, Loader=Loader)
-                import_yaml(data, request.user.id)
-                return Response({'Status': True})
+                job = import_price_list(url, request.user.id, force,
+                                        interval)
+                return Response({'Status': True, 'job_id': job.id})
 
         return Response({'Status': False,
                          'Errors': 'Не указаны все необходимые аргументы'})
 
 
+class PartnerUpdateStatus(APIView):
+    """
+    Класс для получения статуса загрузки прайса
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id, *args, **kwargs):
+        if request.user.type != 'shop':
+            return Response({'Status': False,
+                             'Error': 'Только для магазинов'},
+                            status=403)
+
+        job = ImportJob.objects.filter(id=job_id,
+                                       user_id=request.user.id).first()
+        if not job:
+            return Response({'Status': False, 'Error': 'Загрузка не найдена'},
+                            status=404)
+
+        data = ImportJobSerializer(job).data
+        # ход выполнения задача пишет только в backend результатов celery
+        if job.status == 'running':
+            result = AsyncResult(str(job.id))
+            if result.state == 'PROGRESS':
+                data.update(result.info)
+        return Response(data)
+
+
 class PartnerState(APIView):
     """
     Класс для работы со статусом поставщика
@@ -73,8 +112,10 @@ class PartnerState(APIView):
         state = request.data.get('state')
         if state:
             try:
-                Shop.objects.filter(user_id=request.user.id)\
-                    .update(state=strtobool(state))
+                with transaction.atomic():
+                    Shop.objects.filter(user_id=request.user.id)\
+                        .update(state=strtobool(state))
+                    invalidate_catalog([request.user.shop.id])
                 return Response({'Status': True})
             except ValueError as error:
                 return Response({'Status': False, 'Errors': str(error)})
@@ -83,28 +124,26 @@ class PartnerState(APIView):
                          'Errors': 'Не указаны все необходимые аргументы'})
 
 
-class PartnerOrders(APIView):
+class PartnerOrders(OrderHistoryMixin, GenericAPIView):
     """
     Класс для получения заказов поставщиками
     """
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        # сумма оформленного заказа хранится в заказе, поэтому вместо
+        # соединения с позициями используется подзапрос
+        return Order.objects\
+            .filter(Exists(OrderItem.objects.filter(
+                order_id=OuterRef('pk'),
+                product_info__shop__user_id=self.request.user.id)))\
+            .exclude(status='basket')
+
     def get(self, request, *args, **kwargs):
         if request.user.type != 'shop':
             return Response({'Status': False, 'Error': 'Только для магазинов'},
                             status=403)
 
-        order = Order.objects\
-            .filter(
-                ordered_items__product_info__shop__user_id=request.user.id)\
-            .exclude(status='basket')\
-            .prefetch_related(
-                'ordered_items__product_info__product__category',
-                'ordered_items__product_info__product_parameters__parameter')\
-            .select_related('contact')\
-            .annotate(total_sum=Sum(F('ordered_items__quantity') *
-                                    F('ordered_items__product_info__price')))\
-            .distinct()
-
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        # 304 отдается по версиям заказов до запросов к заказам
+        etag = orders_etag(request, [partner_orders_version(request.user.id)])
+        return conditional_response(request, etag, self.get_page)
@@ -0,0 +1,102 @@
+from time import perf_counter
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from orders.models import Order, OrderItem
+from orders.rows import OrderRows
+from orders.serializers import OrderSerializer
+from partners.generator import generate_price_list
+from partners.tasks import __import_yaml
+from products.models import CatalogOffer, ProductInfo
+from products.rows import CatalogOfferRows
+from products.serializers import CatalogOfferSerializer
+from users.models import User, Contact
+
+
+def measure(build, repeat):
+    """
+    Замеряет лучшее время вызова в миллисекундах и число запросов
+    """
+    best = None
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            start = perf_counter()
+            data = build()
+            wall = perf_counter() - start
+        best = wall if best is None else min(best, wall)
+    return round(best * 1000, 3), len(context.captured_queries), data
+
+
+def compare(serializer, rows, repeat):
+    """
+    Сравнивает ModelSerializer и сборку из строк .values()
+
+    Каждый способ задается парой (выборка, сборка ответа). Замеряется
+    весь ответ с запросами и отдельно сборка по заранее выбранным данным,
+    ответы должны совпадать побайтно.
+    """
+    results = {}
+    for name, (fetch, build) in (('serializer', serializer),
+                                 ('rows', rows)):
+        ms, queries, data = measure(lambda: build(fetch()), repeat)
+        fetched = fetch()
+        build_ms = measure(lambda: build(fetched), repeat)[0]
+        results[name] = {'ms': ms, 'build_ms': build_ms,
+                         'queries': queries,
+                         'content': JSONRenderer().render(data)}
+    serializer, rows = results['serializer'], results['rows']
+    return {'serializer': serializer,
+            'rows': rows,
+            'speedup': round(serializer['ms'] / rows['ms'], 2),
+            'build_speedup': round(serializer['build_ms']
+                                   / rows['build_ms'], 2),
+            'identical': serializer.pop('content') == rows.pop('content')}
+
+
+def run_benchmark(offers=1000, page_size=10, orders=10, items=10,
+                  parameters=5, repeat=20):
+    """
+    Замеряет выдачу страницы каталога и списка заказов с вложенными
+    позициями на синтетических данных. Все изменения откатываются.
+    """
+    results = {}
+    with transaction.atomic():
+        shop = User.objects.create(email='benchmark-shop@localhost',
+                                   type='shop')
+        __import_yaml(generate_price_list(offers, parameters), shop.id)
+
+        buyer = User.objects.create(email='benchmark-buyer@localhost')
+        contact = Contact.objects.create(user=buyer, address='Benchmark',
+                                         phone='+70000000000')
+        product_info_ids = list(ProductInfo.objects
+                                .filter(shop_id=shop.shop.id)
+                                .values_list('id', flat=True)[:items])
+        for _ in range(orders):
+            order = Order.objects.create(user=buyer, contact=contact,
+                                         status='new')
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, product_info_id=product_info_id,
+                          quantity=1)
+                for product_info_id in product_info_ids)
+
+        page = CatalogOffer.objects.filter(shop_id=shop.shop.id)\
+            .order_by('pk')[:page_size]
+        catalog = CatalogOfferRows()
+        results['products'] = compare(
+            (lambda: list(page.all()),
+             lambda offers: CatalogOfferSerializer(offers, many=True).data),
+            (lambda: list(page.values(*catalog.columns)), catalog.many),
+            repeat)
+
+        queryset = Order.objects.filter(user_id=buyer.id)\
+            .exclude(status='basket').order_by('-dt')
+        rows = OrderRows()
+        results['orders'] = compare(
+            (lambda: list(OrderSerializer.setup_queryset(queryset)),
+             lambda orders: OrderSerializer(orders, many=True).data),
+            (lambda: rows.fetch(queryset), rows.many),
+            repeat)
+        transaction.set_rollback(True)
+    return results
@@ -0,0 +1,125 @@
+from hashlib import md5
+from time import time_ns
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+
+# весь каталог, список категорий и предложения отдельного магазина
+CATALOG_VERSION = 'catalog:version'
+CATEGORIES_VERSION = 'catalog:categories:version'
+SHOP_VERSION = 'catalog:shop:{}:version'
+
+
+def shop_version(shop_id):
+    return SHOP_VERSION.format(shop_id)
+
+
+def get_versions(keys):
+    """
+    Возвращает текущие версии каталога. Отсутствующая версия создается
+    с уникальным значением, чтобы не совпасть с ключами вытесненной.
+    """
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time_ns(), timeout=None)
+
+
+def invalidate_catalog(shop_ids=(), categories=False):
+    """
+    Сбрасывает кэш каталога после фиксации текущей транзакции
+    """
+    keys = [CATALOG_VERSION] + [shop_version(shop_id)
+                                for shop_id in set(shop_ids)]
+    if categories:
+        keys.append(CATEGORIES_VERSION)
+    transaction.on_commit(lambda: bump_versions(keys))
+
+
+def normalized_query(request):
+    """
+    Строка запроса с отсортированными параметрами
+    """
+    return urlencode(sorted((name, value) for name, values
+                            in request.query_params.lists()
+                            for value in values))
+
+
+def make_etag(request, *parts):
+    """
+    Строгий ETag из версий данных, строки запроса и формата ответа
+    """
+    parts = (*parts, normalized_query(request),
+             request.accepted_renderer.format)
+    value = ':'.join(str(part) for part in parts)
+    return f'"{md5(value.encode()).hexdigest()}"'
+
+
+def conditional_response(request, etag, build):
+    """
+    Возвращает 304 при совпадении If-None-Match до построения ответа,
+    иначе ответ build() с заголовком ETag
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = build()
+    response['ETag'] = etag
+    return response
+
+
+class CatalogCacheMixin:
+    """
+    Класс для кэширования ответов списков каталога
+
+    Ключ строится из имени представления, версий каталога и
+    нормализованной строки запроса, включая страницу. Изменение каталога
+    увеличивает версию, и старые ответы больше не читаются. Тот же ключ
+    служит ETag, поэтому повторный запрос с If-None-Match получает 304
+    без обращения к кэшу данных и базе.
+    """
+    cache_timeout = settings.CATALOG_CACHE_TIMEOUT
+
+    def get_cache_versions(self):
+        return [CATALOG_VERSION]
+
+    def get_cache_key(self, request):
+        query = normalized_query(request)
+        versions = '.'.join(str(version) for version
+                            in get_versions(self.get_cache_versions()))
+        return f'catalog:{self.__class__.__name__}:{versions}:' \
+               f'{md5(query.encode()).hexdigest()}'
+
+    def cached(self, request, build):
+        """
+        Возвращает ответ с данными из кэша, при промахе строит и кэширует их
+        """
+        key = self.get_cache_key(request)
+
+        def get_response():
+            data = cache.get(key)
+            if data is None:
+                data = build()
+                cache.set(key, data, self.cache_timeout)
+            return Response(data)
+
+        return conditional_response(request, make_etag(request, key),
+                                    get_response)
+
+    def list(self, request, *args, **kwargs):
+        parent = super()
+        return self.cached(
+            request, lambda: parent.list(request, *args, **kwargs).data)
@@ -0,0 +1,82 @@
+from django.db import connection
+
+from products.models import CatalogOffer, Category, Parameter, Product, \
+    ProductInfo, ProductParameter
+
+TABLES = {'catalog': CatalogOffer._meta.db_table,
+          'category': Category._meta.db_table,
+          'parameter': Parameter._meta.db_table,
+          'product': Product._meta.db_table,
+          'product_info': ProductInfo._meta.db_table,
+          'product_parameter': ProductParameter._meta.db_table}
+
+# параметры сохраняются в том виде, в котором их отдает api,
+# снятые с продажи предложения в каталог не попадают
+REFRESH_SQL = """
+    INSERT INTO {catalog} (product_info_id, shop_id, product_id,
+                           product_name, category_id, category_name, model,
+                           quantity, price, price_rrc, parameters,
+                           search_vector)
+    SELECT i.id, i.shop_id, p.id, p.name, c.id, c.name, i.model,
+           i.quantity, i.price, i.price_rrc,
+           coalesce((SELECT jsonb_agg(jsonb_build_object(
+                                'parameter', pr.name, 'value', pp.value)
+                            ORDER BY pp.id)
+                     FROM {product_parameter} pp
+                     JOIN {parameter} pr ON pr.id = pp.parameter_id
+                     WHERE pp.product_info_id = i.id), '[]'::jsonb),
+           i.search_vector
+    FROM {product_info} i
+    JOIN {product} p ON p.id = i.product_id
+    JOIN {category} c ON c.id = p.category_id
+    WHERE NOT i.delisted AND ({condition})
+    ON CONFLICT (product_info_id) DO UPDATE SET
+        shop_id = EXCLUDED.shop_id, product_id = EXCLUDED.product_id,
+        product_name = EXCLUDED.product_name,
+        category_id = EXCLUDED.category_id,
+        category_name = EXCLUDED.category_name, model = EXCLUDED.model,
+        quantity = EXCLUDED.quantity, price = EXCLUDED.price,
+        price_rrc = EXCLUDED.price_rrc, parameters = EXCLUDED.parameters,
+        search_vector = EXCLUDED.search_vector
+    WHERE ({catalog}.shop_id, {catalog}.product_id, {catalog}.product_name,
+           {catalog}.category_id, {catalog}.category_name, {catalog}.model,
+           {catalog}.quantity, {catalog}.price, {catalog}.price_rrc,
+           {catalog}.parameters, {catalog}.search_vector)
+        IS DISTINCT FROM
+          (EXCLUDED.shop_id, EXCLUDED.product_id, EXCLUDED.product_name,
+           EXCLUDED.category_id, EXCLUDED.category_name, EXCLUDED.model,
+           EXCLUDED.quantity, EXCLUDED.price, EXCLUDED.price_rrc,
+           EXCLUDED.parameters, EXCLUDED.search_vector)
+"""
+REFRESH_CONDITIONS = {'shop_ids': 'i.shop_id = ANY(%s)',
+                      'offer_ids': 'i.id = ANY(%s)',
+                      'product_ids': 'i.product_id = ANY(%s)'}
+
+
+def refresh_catalog(**ids):
+    """
+    Пересобирает строки каталога для предложений магазинов, отдельных
+    предложений или продуктов: shop_ids, offer_ids, product_ids.
+    Неизменившиеся строки не перезаписываются.
+    """
+    ids = {name: list(values) for name, values in ids.items() if values}
+    if not ids:
+        return 0
+    condition = ' OR '.join(REFRESH_CONDITIONS[name] for name in ids)
+    with connection.cursor() as cursor:
+        cursor.execute(REFRESH_SQL.format(condition=condition, **TABLES),
+                       list(ids.values()))
+        return cursor.rowcount
+
+
+def refresh_categories(category_ids):
+    """
+    Обновляет наименования переименованных категорий в каталоге
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE {TABLES['catalog']} o SET category_name = c.name
+            FROM {TABLES['category']} c
+            WHERE c.id = o.category_id AND c.id = ANY(%s)
+                AND o.category_name <> c.name""", [list(category_ids)])
+        return cursor.rowcount
@@ -1,11 +1,102 @@
+import re
+from functools import lru_cache
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, \
+    TrigramSimilarity
+from django.db import connection
+from django.db.models import Exists, OuterRef, F
 from django_filters import FilterSet, filters
+from django_filters.constants import EMPTY_VALUES
+from rest_framework.exceptions import ValidationError
+
+from products.models import CatalogOffer, ProductParameter, parse_number
+
+# param[Имя]=значение, param_min[Имя]=число, param_max[Имя]=число
+PARAMETER_FILTER = re.compile(r'^(param|param_min|param_max)\[(.+)\]$')
+PARAMETER_LOOKUPS = {'param': 'value__in',
+                     'param_min': 'value_number__gte',
+                     'param_max': 'value_number__lte'}
+# поля сортировки выдачи, для каждого есть индекс (..., поле, pk)
+ORDERING_FIELDS = ('price', 'quantity')
+
+
+@lru_cache(maxsize=None)
+def has_trigram():
+    """
+    Проверяет, установлено ли расширение pg_trgm
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
 
-from products.models import ProductInfo
+class OfferOrderingFilter(filters.OrderingFilter):
+    """
+    Класс сортировки с добавлением первичного ключа для стабильного порядка
+    """
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        return qs.order_by(*[self.get_ordering_value(param)
+                             for param in value], 'pk')
 
 
 class ProductFilter(FilterSet):
-    category_id = filters.NumberFilter('product__category_id')
+    category_id = filters.NumberFilter('category_id')
+    search = filters.CharFilter(method='filter_search')
+    price_min = filters.NumberFilter('price', lookup_expr='gte')
+    price_max = filters.NumberFilter('price', lookup_expr='lte')
+    in_stock = filters.BooleanFilter(method='filter_in_stock')
+    # сортировка объявлена последней и заменяет ранжирование поиска
+    ordering = OfferOrderingFilter(fields=ORDERING_FIELDS)
 
     class Meta:
-        model = ProductInfo
+        model = CatalogOffer
         fields = ['shop_id', 'category_id']
+
+    def filter_queryset(self, queryset):
+        # поиск применяется последним, после всех остальных условий
+        for key in self.data:
+            match = PARAMETER_FILTER.match(key)
+            if match:
+                queryset = queryset.filter(
+                    Exists(self.filter_parameter(key, *match.groups())))
+        return super().filter_queryset(queryset)
+
+    def filter_search(self, queryset, name, value):
+        """
+        Полнотекстовый поиск по названию продукта и модели с ранжированием
+        в базе, если совпадений нет - поиск похожих названий по триграммам
+        """
+        query = SearchQuery(value, config='russian', search_type='websearch')
+        found = queryset.filter(search_vector=query)
+        if has_trigram() and not found.exists():
+            return queryset.filter(product_name__trigram_similar=value)\
+                .annotate(rank=TrigramSimilarity('product_name', value))\
+                .order_by('-rank', 'pk')
+        return found.annotate(rank=SearchRank(F('search_vector'), query))\
+            .order_by('-rank', 'pk')
+
+    def filter_in_stock(self, queryset, name, value):
+        """
+        Условие совпадает с частичными индексами каталога по наличию
+        """
+        if value:
+            return queryset.filter(quantity__gt=0)
+        return queryset.filter(quantity=0)
+
+    def filter_parameter(self, key, lookup, name):
+        """
+        Подзапрос параметров предложения, использует индексы
+        (параметр, значение) и (параметр, числовое значение)
+        """
+        if lookup == 'param':
+            value = self.data.getlist(key)
+        else:
+            value = parse_number(self.data[key])
+            if value is None:
+                raise ValidationError({key: ['Введите число.']})
+        return ProductParameter.objects.filter(
+            product_info=OuterRef('pk'), parameter__name=name,
+            **{PARAMETER_LOOKUPS[lookup]: value})
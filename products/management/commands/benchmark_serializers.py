@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.benchmark import run_benchmark
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает скорость выдачи каталога и заказов через '
+            'ModelSerializer и сборку из строк .values()')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--offers', type=int, default=1000)
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--orders', type=int, default=10)
+        parser.add_argument('--items', type=int, default=10)
+        parser.add_argument('--parameters', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        results = run_benchmark(options['offers'], options['page_size'],
+                                options['orders'], options['items'],
+                                options['parameters'], options['repeat'])
+
+        for name, result in results.items():
+            for path in ('serializer', 'rows'):
+                metrics = result[path]
+                self.stdout.write(f'{name:<9} {path:<11} '
+                                  f'{metrics["ms"]:>9.3f} ms '
+                                  f'{metrics["build_ms"]:>9.3f} ms build '
+                                  f'{metrics["queries"]:>4} queries')
+            self.stdout.write(f'{name:<9} speedup x{result["speedup"]}, '
+                              f'build x{result["build_speedup"]}')
+
+        if not all(result['identical'] for result in results.values()):
+            raise CommandError('Ответы сериализаторов различаются')
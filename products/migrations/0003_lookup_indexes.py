@@ -0,0 +1,21 @@
+# Generated by Django 4.2.1 on 2026-10-18 20:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_productinfo_unique_shop_external_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='parameter',
+            index=models.Index(fields=['name'], name='parameter_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'category'], name='product_name_category_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.1 on 2026-10-18 21:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productparameter',
+            name='value_number',
+            field=models.FloatField(blank=True, null=True, verbose_name='Числовое значение'),
+        ),
+        migrations.RunSQL(
+            r"""
+            UPDATE products_productparameter
+            SET value_number = replace(value, ',', '.')::double precision
+            WHERE replace(value, ',', '.')
+                ~ '^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d{1,2})?\s*$'
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter', 'value'], name='product_parameter_value_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter', 'value_number'], name='product_parameter_number_idx'),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 4.2.1 on 2026-10-18 21:23
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_VECTOR_SQL = """
+CREATE FUNCTION products_search_vector(name text, model text)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('russian', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('russian',
+                                 translate(coalesce(model, ''), '/', ' ')),
+                     'B')
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE FUNCTION products_productinfo_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := products_search_vector(
+        (SELECT name FROM products_product WHERE id = NEW.product_id),
+        NEW.model);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER products_productinfo_search_vector
+BEFORE INSERT OR UPDATE OF model, product_id ON products_productinfo
+FOR EACH ROW EXECUTE FUNCTION products_productinfo_search_vector();
+
+CREATE FUNCTION products_product_search_vector() RETURNS trigger AS $$
+BEGIN
+    UPDATE products_productinfo
+    SET search_vector = products_search_vector(NEW.name, model)
+    WHERE product_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER products_product_search_vector
+AFTER UPDATE OF name ON products_product
+FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+EXECUTE FUNCTION products_product_search_vector();
+
+UPDATE products_productinfo i
+SET search_vector = products_search_vector(p.name, i.model)
+FROM products_product p WHERE p.id = i.product_id;
+"""
+
+DROP_SEARCH_VECTOR_SQL = """
+DROP TRIGGER products_product_search_vector ON products_product;
+DROP FUNCTION products_product_search_vector();
+DROP TRIGGER products_productinfo_search_vector ON products_productinfo;
+DROP FUNCTION products_productinfo_search_vector();
+DROP FUNCTION products_search_vector(text, text);
+"""
+
+
+def create_trigram_index(apps, schema_editor):
+    # pg_trgm входит в contrib и может отсутствовать в сборке postgres,
+    # без него поиск работает только по поисковому вектору
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions "
+                       "WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS product_name_trgm_idx '
+                          'ON products_product USING gin (name gin_trgm_ops)')
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute('DROP INDEX IF EXISTS product_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_parameter_value_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunSQL(SEARCH_VECTOR_SQL, DROP_SEARCH_VECTOR_SQL),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_info_search_idx'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.1 on 2026-10-18 21:55
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+FILL_CATALOG_SQL = """
+INSERT INTO products_catalogoffer (product_info_id, shop_id, product_id,
+                                   product_name, category_id, category_name,
+                                   model, quantity, price, price_rrc,
+                                   parameters, search_vector)
+SELECT i.id, i.shop_id, p.id, p.name, c.id, c.name, i.model,
+       i.quantity, i.price, i.price_rrc,
+       coalesce((SELECT jsonb_agg(jsonb_build_object(
+                            'parameter', pr.name, 'value', pp.value)
+                        ORDER BY pp.id)
+                 FROM products_productparameter pp
+                 JOIN products_parameter pr ON pr.id = pp.parameter_id
+                 WHERE pp.product_info_id = i.id), '[]'::jsonb),
+       i.search_vector
+FROM products_productinfo i
+JOIN products_product p ON p.id = i.product_id
+JOIN products_category c ON c.id = p.category_id;
+"""
+
+
+def create_trigram_index(apps, schema_editor):
+    # индекс создается, только если установлено расширение pg_trgm
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS '
+                          'catalog_offer_name_trgm_idx '
+                          'ON products_catalogoffer '
+                          'USING gin (product_name gin_trgm_ops)')
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute('DROP INDEX IF EXISTS catalog_offer_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partners', '0004_shop_refresh_interval'),
+        ('products', '0005_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogOffer',
+            fields=[
+                ('product_info', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog_offer', serialize=False, to='products.productinfo', verbose_name='Предложение')),
+                ('product_name', models.CharField(max_length=80, verbose_name='Название продукта')),
+                ('category_name', models.CharField(max_length=40, verbose_name='Наименование категории')),
+                ('model', models.CharField(blank=True, max_length=80, verbose_name='Модель')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('price', models.PositiveIntegerField(verbose_name='Цена')),
+                ('price_rrc', models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')),
+                ('parameters', models.JSONField(blank=True, default=list, verbose_name='Параметры')),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(blank=True, null=True, verbose_name='Поисковый вектор')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_offers', to='products.category', verbose_name='Категория')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_offers', to='products.product', verbose_name='Продукт')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_offers', to='partners.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Предложение каталога',
+                'verbose_name_plural': 'Каталог предложений',
+                'ordering': ('-model',),
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='catalog_offer_search_idx')],
+            },
+        ),
+        migrations.RunSQL(FILL_CATALOG_SQL, migrations.RunSQL.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.1 on 2026-10-18 22:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_catalog_offer'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='catalogoffer',
+            index=models.Index(fields=['category', 'price', 'product_info'], name='catalog_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogoffer',
+            index=models.Index(fields=['shop', 'price', 'product_info'], name='catalog_shop_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogoffer',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['category', 'price', 'product_info'], name='catalog_category_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogoffer',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['price', 'product_info'], name='catalog_stock_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogoffer',
+            index=models.Index(fields=['quantity', 'product_info'], name='catalog_quantity_idx'),
+        ),
+    ]
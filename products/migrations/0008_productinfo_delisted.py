@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 22:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_catalog_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='delisted',
+            field=models.BooleanField(default=False, verbose_name='Снято с продажи'),
+        ),
+    ]
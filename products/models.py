@@ -1,8 +1,23 @@
+from math import isfinite
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
 from partners.models import Shop
 
 
+def parse_number(value):
+    """
+    Возвращает числовое значение параметра или None для текстовых значений
+    """
+    try:
+        number = float(str(value).replace(',', '.'))
+    except ValueError:
+        return None
+    return number if isfinite(number) else None
+
+
 class Category(models.Model):
     name = models.CharField('Наименование категории', max_length=40)
     shops = models.ManyToManyField(Shop, verbose_name='Магазины',
@@ -29,6 +44,10 @@ class Product(models.Model):
         verbose_name = 'Продукт'
         verbose_name_plural = "Список продуктов"
         ordering = ('-name',)
+        indexes = [
+            models.Index(fields=['name', 'category'],
+                         name='product_name_category_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -40,6 +59,9 @@ class ProductInfo(models.Model):
     quantity = models.PositiveIntegerField('Количество')
     price = models.PositiveIntegerField('Цена')
     price_rrc = models.PositiveIntegerField('Рекомендуемая розничная цена')
+    # предложение пропало из прайса, но осталось в заказах,
+    # в каталог не попадает
+    delisted = models.BooleanField('Снято с продажи', default=False)
     product = models.ForeignKey(Product, verbose_name='Продукт',
                                 related_name='product_infos',
                                 blank=True,
@@ -48,6 +70,9 @@ class ProductInfo(models.Model):
                              related_name='product_infos',
                              blank=True,
                              on_delete=models.CASCADE)
+    # заполняется триггером по названию продукта и модели
+    search_vector = SearchVectorField('Поисковый вектор', blank=True,
+                                      null=True, editable=False)
 
     class Meta:
         verbose_name = 'Информация о продукте'
@@ -56,6 +81,12 @@ class ProductInfo(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product', 'shop', 'external_id'],
                                     name='unique_product_info'),
+            models.UniqueConstraint(fields=['shop', 'external_id'],
+                                    name='unique_shop_external_id'),
+        ]
+        indexes = [
+            GinIndex(fields=['search_vector'],
+                     name='product_info_search_idx'),
         ]
 
     def __str__(self):
@@ -69,6 +100,9 @@ class Parameter(models.Model):
         verbose_name = 'Имя параметра'
         verbose_name_plural = "Список имен параметров"
         ordering = ('-name',)
+        indexes = [
+            models.Index(fields=['name'], name='parameter_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -76,6 +110,8 @@ class Parameter(models.Model):
 
 class ProductParameter(models.Model):
     value = models.CharField('Значение', max_length=100)
+    value_number = models.FloatField('Числовое значение', blank=True,
+                                     null=True)
     product_info = models.ForeignKey(ProductInfo,
                                      verbose_name='Информация о продукте',
                                      related_name='product_parameters',
@@ -93,3 +129,69 @@ class ProductParameter(models.Model):
             models.UniqueConstraint(fields=['product_info', 'parameter'],
                                     name='unique_product_parameter'),
         ]
+        indexes = [
+            models.Index(fields=['parameter', 'value'],
+                         name='product_parameter_value_idx'),
+            models.Index(fields=['parameter', 'value_number'],
+                         name='product_parameter_number_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.value_number = parse_number(self.value)
+        super().save(*args, **kwargs)
+
+
+class CatalogOffer(models.Model):
+    # денормализованная строка каталога для чтения, пересобирается
+    # при загрузке прайса магазина
+    product_info = models.OneToOneField(ProductInfo,
+                                        verbose_name='Предложение',
+                                        related_name='catalog_offer',
+                                        primary_key=True,
+                                        on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин',
+                             related_name='catalog_offers',
+                             on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, verbose_name='Продукт',
+                                related_name='catalog_offers',
+                                on_delete=models.CASCADE)
+    product_name = models.CharField('Название продукта', max_length=80)
+    category = models.ForeignKey(Category, verbose_name='Категория',
+                                 related_name='catalog_offers',
+                                 on_delete=models.CASCADE)
+    category_name = models.CharField('Наименование категории',
+                                     max_length=40)
+    model = models.CharField('Модель', max_length=80, blank=True)
+    quantity = models.PositiveIntegerField('Количество')
+    price = models.PositiveIntegerField('Цена')
+    price_rrc = models.PositiveIntegerField('Рекомендуемая розничная цена')
+    parameters = models.JSONField('Параметры', default=list, blank=True)
+    search_vector = SearchVectorField('Поисковый вектор', blank=True,
+                                      null=True)
+
+    class Meta:
+        verbose_name = 'Предложение каталога'
+        verbose_name_plural = "Каталог предложений"
+        ordering = ('-model',)
+        indexes = [
+            GinIndex(fields=['search_vector'],
+                     name='catalog_offer_search_idx'),
+            # сортировка по цене внутри категории и магазина, pk в конце
+            # индекса позволяет обойтись без сортировки при пагинации
+            models.Index(fields=['category', 'price', 'product_info'],
+                         name='catalog_category_price_idx'),
+            models.Index(fields=['shop', 'price', 'product_info'],
+                         name='catalog_shop_price_idx'),
+            # частичные индексы для предложений в наличии
+            models.Index(fields=['category', 'price', 'product_info'],
+                         condition=models.Q(quantity__gt=0),
+                         name='catalog_category_stock_idx'),
+            models.Index(fields=['price', 'product_info'],
+                         condition=models.Q(quantity__gt=0),
+                         name='catalog_stock_price_idx'),
+            models.Index(fields=['quantity', 'product_info'],
+                         name='catalog_quantity_idx'),
+        ]
+
+    def __str__(self):
+        return self.model
@@ -0,0 +1,60 @@
+from collections import OrderedDict
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from products.filters import ORDERING_FIELDS
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Класс курсорной пагинации товаров по ИД
+
+    Страница выбирается условием по первичному ключу вместо OFFSET,
+    поэтому стоимость запроса не зависит от номера страницы. Общее число
+    строк считается только для первой страницы, параметр count=false
+    отключает подсчет. Параметр ordering задает сортировку по цене или
+    количеству, курсор тогда строится по этому полю. Ранжирование поиска
+    курсором не поддерживается, поиск без ordering отклоняется.
+    """
+    ordering = 'pk'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    ordering_query_param = 'ordering'
+    search_query_param = 'search'
+
+    @classmethod
+    def is_requested(cls, request):
+        return request.query_params.get(cls.mode_query_param) == 'cursor' \
+            or cls.cursor_query_param in request.query_params
+
+    def get_ordering(self, request, queryset, view):
+        ordering = request.query_params.get(self.ordering_query_param, '')
+        if ordering.lstrip('-') in ORDERING_FIELDS:
+            return (ordering, 'pk')
+        if request.query_params.get(self.search_query_param):
+            # порядок по pk молча потерял бы сортировку по релевантности
+            raise ValidationError({self.search_query_param: [
+                'Поиск по релевантности не поддерживает курсорную '
+                'пагинацию, используйте постраничную или ordering.']})
+        return super().get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if self.cursor_query_param not in request.query_params \
+                and request.query_params.get(self.count_query_param,
+                                             'true').lower() != 'false':
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
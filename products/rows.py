@@ -0,0 +1,143 @@
+from operator import itemgetter
+
+from django.db.models import F
+
+from products.models import ProductInfo, ProductParameter
+
+
+class RowSerializer:
+    """
+    Класс для быстрой сборки ответа из строк .values() в словари
+
+    Карта полей (имя, функция от строки) составляется один раз при
+    создании с учетом дерева запрошенных полей, поэтому на каждую строку
+    приходится только вызов готовых функций. Результат совпадает
+    с выводом соответствующего ModelSerializer.
+    """
+    # поля в порядке вывода сериализатора
+    field_names = ()
+    # колонки .values() для полей, если имя колонки отличается от поля
+    field_columns = {}
+
+    def __init__(self, field_tree=None):
+        self.field_tree = field_tree
+        self.field_map = tuple(
+            (name, self.get_field(name, self.get_subtree(name)))
+            for name in self.field_names
+            if not field_tree or name in field_tree)
+
+    def get_subtree(self, name):
+        return self.field_tree[name] if self.field_tree else None
+
+    def get_field(self, name, field_tree):
+        """
+        Возвращает функцию получения значения поля из строки
+        """
+        return itemgetter(*self.field_columns.get(name, (name,)))
+
+    @property
+    def columns(self):
+        """
+        Колонки, которые нужно выбрать для запрошенных полей
+        """
+        return [column for name, _ in self.field_map
+                for column in self.field_columns.get(name, (name,))]
+
+    def has_field(self, name):
+        return any(name == field for field, _ in self.field_map)
+
+    def to_representation(self, row):
+        return {name: get(row) for name, get in self.field_map}
+
+    def many(self, rows):
+        to_representation = self.to_representation
+        return [to_representation(row) for row in rows]
+
+
+class ProductRows(RowSerializer):
+    """
+    Продукт предложения каталога в формате ProductSerializer
+    """
+    field_names = ('name', 'category')
+    field_columns = {'name': ('product_name',),
+                     'category': ('category_name',)}
+
+
+class CatalogParameterRows(RowSerializer):
+    """
+    Параметры строки каталога в формате ProductParameterSerializer,
+    словари собираются заново, так как jsonb не сохраняет порядок ключей
+    """
+    field_names = ('parameter', 'value')
+
+
+class CatalogOfferRows(RowSerializer):
+    """
+    Строки каталога в формате CatalogOfferSerializer
+    """
+    field_names = ('id', 'model', 'product', 'shop', 'quantity', 'price',
+                   'price_rrc', 'product_parameters')
+    field_columns = {'id': ('product_info_id',),
+                     'product': ('product_name', 'category_name'),
+                     'shop': ('shop_id',),
+                     'product_parameters': ('parameters',)}
+
+    def get_field(self, name, field_tree):
+        if name == 'product':
+            return ProductRows(field_tree).to_representation
+        if name == 'product_parameters':
+            parameters = CatalogParameterRows(field_tree)
+            return lambda row: parameters.many(row['parameters'])
+        return super().get_field(name, field_tree)
+
+
+class ProductParameterRows(RowSerializer):
+    """
+    Параметры предложения в формате ProductParameterSerializer
+    """
+    field_names = ('parameter', 'value')
+    field_columns = {'parameter': ('parameter_name',)}
+
+
+class ProductInfoRows(RowSerializer):
+    """
+    Предложения в формате ProductInfoSerializer
+    """
+    field_names = ('id', 'model', 'product', 'shop', 'quantity', 'price',
+                   'price_rrc', 'product_parameters')
+    field_columns = {'product': (),
+                     'shop': ('shop_id',),
+                     'product_parameters': ()}
+
+    def get_field(self, name, field_tree):
+        if name == 'product':
+            return ProductRows(field_tree).to_representation
+        if name == 'product_parameters':
+            parameters = ProductParameterRows(field_tree)
+            return lambda row: parameters.many(row['parameters'])
+        return super().get_field(name, field_tree)
+
+    def fetch(self, ids):
+        """
+        Выбирает предложения с продуктом и категорией одним запросом,
+        параметры вторым, и возвращает строки по ИД предложения
+        """
+        related = {}
+        if self.has_field('product'):
+            related = {'product_name': F('product__name'),
+                       'category_name': F('product__category__name')}
+        rows = {row['id']: row for row in ProductInfo.objects
+                .filter(id__in=ids).order_by()
+                .values(*dict.fromkeys(['id', *self.columns]), **related)}
+
+        if self.has_field('product_parameters'):
+            for row in rows.values():
+                row['parameters'] = []
+            parameters = ProductParameter.objects\
+                .filter(product_info_id__in=ids).order_by('id')\
+                .values('product_info_id', 'value',
+                        parameter_name=F('parameter__name'))
+            for parameter in parameters:
+                rows[parameter['product_info_id']]['parameters']\
+                    .append(parameter)
+        return rows
@@ -1,7 +1,73 @@
 from rest_framework import serializers
 
 from products.models import Shop, Product, ProductParameter, ProductInfo, \
-    Category
+    Category, CatalogOffer
+
+
+def parse_field_paths(value, tree=None):
+    """
+    Разбирает список полей через запятую (допускаются пути через точку)
+    в дерево {поле: вложенные поля}, пустой словарь означает весь блок
+    """
+    tree = {} if tree is None else tree
+    for path in value.split(','):
+        node = tree
+        names = [name for name in path.strip().split('.') if name]
+        for name in names[:-1]:
+            node = node.setdefault(name, {})
+        if names:
+            node[names[-1]] = {}
+    return tree
+
+
+def requested_fields(request):
+    """
+    Возвращает дерево полей из параметров fields и expand запроса
+    или None, если нужны все поля
+    """
+    fields = request.query_params.get('fields', '')
+    if not fields.strip(', '):
+        return None
+    # expand добавляет к выбранным полям вложенные блоки целиком
+    tree = parse_field_paths(fields)
+    return parse_field_paths(request.query_params.get('expand', ''), tree)
+
+
+def is_requested(tree, path):
+    """
+    Проверяет, попадает ли поле по пути через точку в дерево полей
+    """
+    for name in path.split('.'):
+        if not tree:
+            return True
+        if name not in tree:
+            return False
+        tree = tree[name]
+    return True
+
+
+class SparseFieldsMixin:
+    """
+    Класс для вывода только запрошенных полей сериализатора,
+    дерево полей передается аргументом field_tree
+    """
+
+    def __init__(self, *args, field_tree=None, **kwargs):
+        self.field_tree = field_tree
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.field_tree:
+            return fields
+        for name in list(fields):
+            if name not in self.field_tree:
+                del fields[name]
+                continue
+            nested = getattr(fields[name], 'child', fields[name])
+            if isinstance(nested, SparseFieldsMixin):
+                nested.field_tree = self.field_tree[name]
+        return fields
 
 
 class ShopSerializer(serializers.ModelSerializer):
@@ -11,7 +77,7 @@ class ShopSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category = serializers.StringRelatedField()
 
     class Meta:
@@ -19,7 +85,8 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = ('name', 'category',)
 
 
-class ProductParameterSerializer(serializers.ModelSerializer):
+class ProductParameterSerializer(SparseFieldsMixin,
+                                 serializers.ModelSerializer):
     parameter = serializers.StringRelatedField()
 
     class Meta:
@@ -27,7 +94,7 @@ class ProductParameterSerializer(serializers.ModelSerializer):
         fields = ('parameter', 'value',)
 
 
-class ProductInfoSerializer(serializers.ModelSerializer):
+class ProductInfoSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_parameters = ProductParameterSerializer(read_only=True, many=True)
 
@@ -43,3 +110,35 @@ class CategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = ('id', 'name',)
         read_only_fields = ('id',)
+
+
+class CatalogOfferSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Класс для выдачи строки каталога в формате ProductInfoSerializer
+    """
+    id = serializers.IntegerField(source='product_info_id')
+    product = serializers.SerializerMethodField()
+    shop = serializers.IntegerField(source='shop_id')
+    product_parameters = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CatalogOffer
+        fields = ('id', 'model', 'product', 'shop', 'quantity', 'price',
+                  'price_rrc', 'product_parameters',)
+        read_only_fields = fields
+
+    def get_product(self, obj):
+        product = {'name': obj.product_name, 'category': obj.category_name}
+        if self.field_tree and self.field_tree['product']:
+            return {name: value for name, value in product.items()
+                    if name in self.field_tree['product']}
+        return product
+
+    def get_product_parameters(self, obj):
+        # jsonb не сохраняет порядок ключей, словари собираются заново
+        names = ('parameter', 'value')
+        if self.field_tree and self.field_tree['product_parameters']:
+            names = [name for name in names
+                     if name in self.field_tree['product_parameters']]
+        return [{name: parameter[name] for name in names}
+                for parameter in obj.parameters]
@@ -0,0 +1,48 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from partners.models import Shop
+from products.cache import invalidate_catalog
+from products.catalog import refresh_catalog, refresh_categories
+from products.models import Category, Product, ProductInfo, \
+    ProductParameter
+
+# загрузка прайса пишет каталог пакетно, сама пересобирает каталог для
+# чтения и сбрасывает кэш, обработчики покрывают изменения через админку
+# и модели. Предложения и
+# параметры без post_delete: обработчик удаления отключил бы быстрое
+# удаление при загрузке, а в админке их удаляют через форму магазина
+# или продукта, сохранение которых сбрасывает кэш.
+
+
+@receiver([post_save, post_delete], sender=Shop)
+def shop_changed(sender, instance, **kwargs):
+    invalidate_catalog([instance.id])
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, instance, **kwargs):
+    if kwargs['signal'] is post_save:
+        refresh_categories([instance.id])
+    invalidate_catalog(categories=True)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, instance, **kwargs):
+    if kwargs['signal'] is post_save:
+        refresh_catalog(product_ids=[instance.id])
+    invalidate_catalog(ProductInfo.objects.filter(product_id=instance.id)
+                       .values_list('shop_id', flat=True))
+
+
+@receiver(post_save, sender=ProductInfo)
+def product_info_changed(sender, instance, **kwargs):
+    refresh_catalog(offer_ids=[instance.id])
+    invalidate_catalog([instance.shop_id])
+
+
+@receiver(post_save, sender=ProductParameter)
+def product_parameter_changed(sender, instance, **kwargs):
+    refresh_catalog(offer_ids=[instance.product_info_id])
+    invalidate_catalog(ProductInfo.objects.filter(id=instance.product_info_id)
+                       .values_list('shop_id', flat=True))
@@ -1,11 +1,22 @@
+import json
+
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from model_bakery import baker
 from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 
+from partners.importer import PriceListImporter
 from partners.models import Shop
-from products.models import Category, ProductInfo, Product
+from products.benchmark import run_benchmark
+from products.filters import has_trigram
+from products.models import Category, ProductInfo, Product, Parameter, \
+    ProductParameter, CatalogOffer
+from products.serializers import CatalogOfferSerializer, \
+    ProductInfoSerializer, parse_field_paths
 from users.models import User
 
 
@@ -51,6 +62,13 @@ def product_factory():
     return factory
 
 
+def app_queries(context):
+    # запросы профилировщика silk не относятся к обработке запроса
+    return [query['sql'] for query in context.captured_queries
+            if 'silk_' not in query['sql']
+            and not query['sql'].startswith('EXPLAIN')]
+
+
 @pytest.mark.django_db
 def test_get_categories(client, user_factory, category_factory):
     """Get categories test"""
@@ -94,3 +112,445 @@ def test_get_products(client, user_factory, product_factory,
 
     data = response.json()
     assert data['results'][0]['product']['category'] == category.name
+
+
+@pytest.mark.django_db
+def test_get_products_format(client, user_factory, product_factory,
+                             category_factory, shop_factory):
+    """Catalog offers render byte-identical to ProductInfoSerializer test"""
+    user, header_auth = user_factory()
+    category = category_factory()
+    shop = shop_factory(user.id)
+    offers = [product_factory(category.id, shop.id) for _ in range(2)]
+    for offer in offers:
+        for name, value in (('Цвет', 'черный'), ('Вес', '10')):
+            ProductParameter.objects.create(
+                product_info=offer, value=value,
+                parameter=Parameter.objects.get_or_create(name=name)[0])
+
+    def render(data):
+        return JSONRenderer().render(sorted(data, key=lambda item: item['id']))
+
+    expected = render(ProductInfoSerializer(
+        ProductInfo.objects.filter(shop=shop), many=True).data)
+    response = client.get(reverse('products'), headers=header_auth)
+    assert render(json.loads(response.content)['results']) == expected
+    assert render(CatalogOfferSerializer(
+        CatalogOffer.objects.filter(shop=shop), many=True).data) == expected
+
+
+@pytest.mark.django_db
+def test_get_products_cursor(client, user_factory, product_factory,
+                             category_factory, shop_factory):
+    """Get products with cursor pagination test"""
+    user, header_auth = user_factory()
+    category = category_factory()
+    shop = shop_factory(user.id)
+    product_ids = sorted(product_factory(category.id, shop.id).id
+                         for _ in range(7))
+
+    url = reverse('products')
+    response = client.get(url, data={'pagination': 'cursor', 'page_size': 3},
+                          headers=header_auth)
+    data = response.json()
+    assert data['count'] == 7
+    ids = [item['id'] for item in data['results']]
+
+    while data['next']:
+        response = client.get(data['next'], headers=header_auth)
+        data = response.json()
+        assert 'count' not in data
+        ids.extend(item['id'] for item in data['results'])
+
+    assert ids == product_ids
+
+
+@pytest.mark.django_db
+def test_get_products_cursor_queries(client, user_factory, product_factory,
+                                     category_factory, shop_factory):
+    """Deep cursor pages run the same queries as the first page test"""
+    user, header_auth = user_factory()
+    category = category_factory()
+    shop = shop_factory(user.id)
+    for _ in range(9):
+        product_factory(category.id, shop.id)
+    url = reverse('products')
+
+    with CaptureQueriesContext(connection) as first:
+        response = client.get(url, data={'pagination': 'cursor',
+                                         'page_size': 3, 'count': 'false'},
+                              headers=header_auth)
+    data = response.json()
+    assert 'count' not in data
+
+    for _ in range(2):
+        with CaptureQueriesContext(connection) as page:
+            response = client.get(data['next'], headers=header_auth)
+        data = response.json()
+        assert len(app_queries(page)) == len(app_queries(first))
+    assert len(data['results']) == 3
+    assert data['next'] is None
+    products = [sql for sql in app_queries(page)
+                if 'FROM "products_catalogoffer"' in sql]
+    assert products
+    assert not any('OFFSET' in sql or 'COUNT(' in sql for sql in products)
+
+
+@pytest.mark.django_db
+def test_get_products_ordering(client, user_factory, category_factory,
+                               shop_factory):
+    """Get products sorted by price with price and stock filters test"""
+    user, header_auth = user_factory()
+    category = category_factory()
+    shop = shop_factory(user.id)
+    offers = {}
+    for price, quantity in ((300, 1), (100, 0), (200, 5), (400, 2), (200, 3)):
+        offer = baker.make(ProductInfo, shop=shop, price=price,
+                           quantity=quantity,
+                           product=baker.make(Product, category=category))
+        offers[offer.id] = price, quantity
+    url = reverse('products')
+
+    response = client.get(url, data={'category_id': category.id,
+                                     'ordering': 'price'},
+                          headers=header_auth)
+    ids = [item['id'] for item in response.json()['results']]
+    assert ids == sorted(offers, key=lambda pk: (offers[pk][0], pk))
+
+    response = client.get(url, data={'category_id': category.id,
+                                     'ordering': '-price', 'in_stock': 'true',
+                                     'price_min': 200, 'price_max': 300},
+                          headers=header_auth)
+    data = response.json()
+    assert data['count'] == 3
+    assert [item['price'] for item in data['results']] == [300, 200, 200]
+
+    response = client.get(url, data={'in_stock': 'false'},
+                          headers=header_auth)
+    assert [item['quantity'] for item in response.json()['results']] == [0]
+
+    response = client.get(url, data={'ordering': '-quantity',
+                                     'pagination': 'cursor', 'page_size': 2},
+                          headers=header_auth)
+    data = response.json()
+    quantities = [item['quantity'] for item in data['results']]
+    while data['next']:
+        data = client.get(data['next'], headers=header_auth).json()
+        quantities.extend(item['quantity'] for item in data['results'])
+    assert quantities == [5, 3, 2, 1, 0]
+
+    response = client.get(url, data={'ordering': 'name'},
+                          headers=header_auth)
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_get_products_fields(client, user_factory, product_factory,
+                             category_factory, shop_factory):
+    """Get products with sparse fieldsets test"""
+    user, header_auth = user_factory()
+    category = category_factory()
+    shop = shop_factory(user.id)
+    offer = product_factory(category.id, shop.id)
+    url = reverse('products')
+
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url, data={'fields': 'id,price',
+                                         'pagination': 'cursor',
+                                         'count': 'false'},
+                              headers=header_auth)
+    assert response.json()['results'] == [{'id': offer.id,
+                                           'price': offer.price}]
+    queries = [sql for sql in app_queries(context)
+               if 'products_catalogoffer' in sql]
+    assert len(queries) == 1
+    assert '"parameters"' not in queries[0]
+    assert '"search_vector"' not in queries[0]
+
+    response = client.get(url, data={'fields': 'id', 'expand': 'product'},
+                          headers=header_auth)
+    assert response.json()['results'] == [
+        {'id': offer.id, 'product': {'name': offer.product.name,
+                                     'category': category.name}}]
+
+    response = client.get(url, data={'fields': 'product.category'},
+                          headers=header_auth)
+    assert response.json()['results'] == [
+        {'product': {'category': category.name}}]
+
+    ProductParameter.objects.create(
+        product_info=offer, value='черный',
+        parameter=baker.make(Parameter, name='Цвет'))
+    expected = [{'id': offer.id, 'product_parameters': [{'value': 'черный'}]}]
+    response = client.get(url, data={'fields': 'id,product_parameters.value'},
+                          headers=header_auth)
+    assert response.json()['results'] == expected
+    serializer = CatalogOfferSerializer(
+        CatalogOffer.objects.filter(pk=offer.id), many=True,
+        field_tree=parse_field_paths('id,product_parameters.value'))
+    assert serializer.data == expected
+
+
+@pytest.mark.django_db
+def test_get_products_by_parameters(client, user_factory, product_factory,
+                                    category_factory, shop_factory):
+    """Filter products by parameter values and numeric ranges test"""
+    user, header_auth = user_factory()
+    category = category_factory()
+    shop = shop_factory(user.id)
+    diagonal = baker.make(Parameter, name='Диагональ (дюйм)')
+    color = baker.make(Parameter, name='Цвет')
+    products = {}
+    for size, value in (('small', '5,5'), ('medium', '6.5'),
+                        ('large', '7')):
+        products[size] = product_factory(category.id, shop.id)
+        ProductParameter.objects.create(product_info=products[size],
+                                        parameter=diagonal, value=value)
+        ProductParameter.objects.create(product_info=products[size],
+                                        parameter=color, value=size)
+    url = reverse('products')
+
+    def search(**params):
+        response = client.get(url, data=params, headers=header_auth)
+        return {item['id'] for item in response.json()['results']}
+
+    assert search(**{'param[Диагональ (дюйм)]': '6.5'}) == \
+        {products['medium'].id}
+    assert search(**{'param[Цвет]': ['small', 'large']}) == \
+        {products['small'].id, products['large'].id}
+    assert search(**{'param_min[Диагональ (дюйм)]': '6',
+                     'param_max[Диагональ (дюйм)]': '7.5'}) == \
+        {products['medium'].id, products['large'].id}
+    assert search(**{'param_max[Диагональ (дюйм)]': '6',
+                     'param[Цвет]': 'large'}) == set()
+
+    response = client.get(url, data={'param_min[Цвет]': 'красный'},
+                          headers=header_auth)
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_search_products(client, user_factory, category_factory,
+                         shop_factory, django_capture_on_commit_callbacks):
+    """Full-text product search ranked by relevance test"""
+    user, header_auth = user_factory()
+    category = category_factory()
+    shop = shop_factory(user.id)
+    phone = baker.make(Product, name='Смартфон Apple iPhone XS',
+                       category=category)
+    case = baker.make(Product, name='Чехол для смартфона',
+                      category=category)
+    by_name = baker.make(ProductInfo, product=phone, shop=shop,
+                         model='apple/iphone/xs')
+    by_model = baker.make(ProductInfo, product=case, shop=shop,
+                          model='iphone/xs/case')
+    baker.make(ProductInfo, product=case, shop=shop, model='samsung/s10')
+    url = reverse('products')
+
+    def search(value):
+        response = client.get(url, data={'search': value},
+                              headers=header_auth)
+        return [item['id'] for item in response.json()['results']]
+
+    assert search('iphone') == [by_name.id, by_model.id]
+    assert search('смартфоны apple') == [by_name.id]
+    assert search('телевизор') == []
+
+    with django_capture_on_commit_callbacks(execute=True):
+        phone.name = 'Телевизор Samsung'
+        phone.save()
+    assert search('телевизор') == [by_name.id]
+
+    # курсор по pk потерял бы ранжирование, поиск с ним отклоняется
+    response = client.get(url, data={'search': 'iphone',
+                                     'pagination': 'cursor'},
+                          headers=header_auth)
+    assert response.status_code == 400
+    assert 'search' in response.json()
+    response = client.get(url, data={'search': 'xs', 'ordering': '-price',
+                                     'pagination': 'cursor'},
+                          headers=header_auth)
+    assert [item['id'] for item in response.json()['results']] == \
+        [offer.id for offer in sorted((by_name, by_model),
+                                      key=lambda offer: (-offer.price,
+                                                         offer.id))]
+
+
+@pytest.mark.django_db
+def test_search_products_typo(client, user_factory, category_factory,
+                              shop_factory):
+    """Trigram search for misspelled product names test"""
+    if not has_trigram():
+        pytest.skip('pg_trgm extension is not installed')
+    user, header_auth = user_factory()
+    category = category_factory()
+    shop = shop_factory(user.id)
+    phone = baker.make(Product, name='Смартфон Apple iPhone XS',
+                       category=category)
+    offer = baker.make(ProductInfo, product=phone, shop=shop)
+
+    response = client.get(reverse('products'),
+                          data={'search': 'Смартфн Apple iPhone'},
+                          headers=header_auth)
+
+    assert [item['id'] for item in response.json()['results']] == [offer.id]
+
+
+@pytest.mark.django_db
+def test_get_products_cache(client, user_factory, product_factory,
+                            category_factory, shop_factory,
+                            django_capture_on_commit_callbacks):
+    """Catalog responses are cached until the catalog changes test"""
+    user, header_auth = user_factory()
+    category = category_factory()
+    shop = shop_factory(user.id)
+    other_shop = shop_factory(baker.make(User).id)
+    offer = product_factory(category.id, shop.id)
+    other_offer = product_factory(category.id, other_shop.id)
+    url = reverse('products')
+
+    def prices(**params):
+        response = client.get(url, data=params, headers=header_auth)
+        return {item['id']: item['price']
+                for item in response.json()['results']}
+
+    assert prices(shop_id=shop.id) == {offer.id: offer.price}
+    assert prices() == {offer.id: offer.price,
+                        other_offer.id: other_offer.price}
+    # изменение в обход моделей не сбрасывает версию каталога
+    CatalogOffer.objects.filter(pk=offer.id).update(price=offer.price + 1)
+    assert prices(shop_id=shop.id) == {offer.id: offer.price}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        other_offer.save()
+    assert prices(shop_id=shop.id) == {offer.id: offer.price}
+    assert prices()[offer.id] == offer.price + 1
+
+    offer.price += 2
+    with django_capture_on_commit_callbacks(execute=True):
+        offer.save()
+    assert prices(shop_id=shop.id) == {offer.id: offer.price}
+
+
+@pytest.mark.django_db
+def test_get_categories_etag(client, user_factory, category_factory,
+                             django_capture_on_commit_callbacks):
+    """Conditional GET returns 304 until the catalog changes test"""
+    user, header_auth = user_factory()
+    category = category_factory()
+    url = reverse('product_categories')
+
+    response = client.get(url, headers=header_auth)
+    etag = response['ETag']
+    assert response.status_code == 200
+
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url, headers={**header_auth,
+                                            'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response['ETag'] == etag
+    assert not [sql for sql in app_queries(context)
+                if 'products_category' in sql]
+
+    response = client.get(url, data={'page': 1},
+                          headers={**header_auth, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+    category.name = 'Смартфоны'
+    with django_capture_on_commit_callbacks(execute=True):
+        category.save()
+    response = client.get(url, headers={**header_auth,
+                                        'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+    assert response.json()['results'][0]['name'] == 'Смартфоны'
+
+
+@pytest.mark.django_db
+def test_get_facets(client, user_factory, category_factory, shop_factory):
+    """Facet counts for the current product filters test"""
+    user, header_auth = user_factory()
+    phones, cases = category_factory(), category_factory()
+    shop = shop_factory(user.id)
+    other_shop = shop_factory(baker.make(User).id)
+    color = baker.make(Parameter, name='Цвет')
+    for category, offer_shop, value in ((phones, shop, 'черный'),
+                                        (phones, shop, 'белый'),
+                                        (phones, other_shop, 'черный'),
+                                        (cases, shop, 'черный')):
+        offer = baker.make(ProductInfo, shop=offer_shop,
+                           product=baker.make(Product, category=category))
+        ProductParameter.objects.create(product_info=offer, parameter=color,
+                                        value=value)
+
+    url = reverse('product_facets')
+    response = client.get(url, data={'category_id': phones.id,
+                                     'shop_id': shop.id},
+                          headers=header_auth)
+
+    data = response.json()
+    assert data['count'] == 2
+    assert data['categories'] == [
+        {'id': phones.id, 'name': phones.name, 'count': 2},
+        {'id': cases.id, 'name': cases.name, 'count': 1}]
+    assert data['shops'] == [
+        {'id': shop.id, 'name': shop.name, 'count': 2},
+        {'id': other_shop.id, 'name': other_shop.name, 'count': 1}]
+    assert data['parameters'] == [
+        {'name': 'Цвет', 'values': [{'value': 'белый', 'count': 1},
+                                    {'value': 'черный', 'count': 1}]}]
+
+    response = client.get(url, data={'param[Цвет]': 'черный'},
+                          headers=header_auth)
+    data = response.json()
+    assert data['count'] == 3
+    assert data['parameters'][0]['values'] == [{'value': 'черный',
+                                                'count': 3}]
+
+    response = client.get(url, data={'param_min[Цвет]': 'черный'},
+                          headers=header_auth)
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_get_facets_cache(client, user_factory, category_factory,
+                          shop_factory, django_capture_on_commit_callbacks):
+    """Shop facet counts change after another shop's import test"""
+    user, header_auth = user_factory()
+    category = category_factory()
+    shop = shop_factory(user.id)
+    other_shop = shop_factory(baker.make(User, type='shop').id)
+    with django_capture_on_commit_callbacks(execute=True):
+        baker.make(ProductInfo, shop=shop,
+                   product=baker.make(Product, category=category))
+    url = reverse('product_facets')
+
+    def shop_counts():
+        response = client.get(url, data={'shop_id': shop.id},
+                              headers=header_auth)
+        return {item['id']: item['count']
+                for item in response.json()['shops']}
+
+    assert shop_counts() == {shop.id: 1}
+    with django_capture_on_commit_callbacks(execute=True):
+        PriceListImporter(other_shop.user_id).run({
+            'shop': other_shop.name,
+            'categories': [{'id': category.id, 'name': category.name}],
+            'goods': [{'id': number, 'category': category.id,
+                       'name': f'Товар {number}', 'price': 100,
+                       'price_rrc': 100, 'quantity': 1}
+                      for number in range(2)]})
+    assert shop_counts() == {shop.id: 1, other_shop.id: 2}
+
+
+@pytest.mark.django_db
+def test_serializer_benchmark():
+    """Serializer benchmark harness test"""
+    results = run_benchmark(offers=20, orders=2, items=3, parameters=2,
+                            repeat=1)
+
+    for result in results.values():
+        assert result['identical']
+        assert result['rows']['queries'] <= result['serializer']['queries']
+    assert not CatalogOffer.objects.exists()
@@ -1,21 +1,30 @@
+from django.db.models import Count, F
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.generics import ListAPIView
+from django_filters.utils import translate_validation
+from rest_framework.generics import GenericAPIView, ListAPIView
 
-from products.filters import ProductFilter
-from products.models import Category, Shop, ProductInfo
+from products.cache import CatalogCacheMixin, CATALOG_VERSION, \
+    CATEGORIES_VERSION, shop_version
+from products.filters import ProductFilter, ORDERING_FIELDS
+from products.models import Category, Shop, CatalogOffer, ProductParameter
+from products.pagination import ProductCursorPagination
 from products.serializers import CategorySerializer, ShopSerializer, \
-    ProductInfoSerializer
+    CatalogOfferSerializer, requested_fields
+from products.rows import CatalogOfferRows
 
 
-class CategoryView(ListAPIView):
+class CategoryView(CatalogCacheMixin, ListAPIView):
     """
     Класс для просмотра категорий
     """
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
+    def get_cache_versions(self):
+        return [CATEGORIES_VERSION]
 
-class ShopView(ListAPIView):
+
+class ShopView(CatalogCacheMixin, ListAPIView):
     """
     Класс для просмотра списка магазинов
     """
@@ -23,13 +32,104 @@ class ShopView(ListAPIView):
     serializer_class = ShopSerializer
 
 
-class ProductInfoView(ListAPIView):
+class OfferCacheMixin(CatalogCacheMixin):
+    """
+    Класс для кэширования выдачи предложений каталога
+    """
+
+    def get_cache_versions(self):
+        # выдача одного магазина зависит только от него и категорий
+        shop_id = self.request.query_params.get('shop_id', '')
+        if shop_id.isdigit():
+            return [shop_version(int(shop_id)), CATEGORIES_VERSION]
+        return [CATALOG_VERSION]
+
+
+class ProductInfoView(OfferCacheMixin, ListAPIView):
     """
     Класс для поиска товаров
     """
-    queryset = ProductInfo.objects.select_related(
-            'shop', 'product__category').prefetch_related(
-            'product_parameters__parameter').distinct()
-    serializer_class = ProductInfoSerializer
+    # одна таблица каталога для чтения вместо соединения пяти таблиц
+    queryset = CatalogOffer.objects.all()
+    serializer_class = CatalogOfferSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = ProductFilter
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(request, self.get_page)
+
+    def get_page(self):
+        """
+        Собирает страницу из строк .values() без ModelSerializer,
+        выбираются только колонки запрошенных полей
+        """
+        rows = CatalogOfferRows(requested_fields(self.request))
+        # pk и поля сортировки нужны курсорной пагинации
+        columns = dict.fromkeys(['pk', *ORDERING_FIELDS, *rows.columns])
+        queryset = self.filter_queryset(self.get_queryset()).values(*columns)
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(rows.many(page)).data
+
+    @property
+    def paginator(self):
+        # pagination=cursor или курсор в запросе включают курсорную пагинацию
+        if not hasattr(self, '_paginator') \
+                and ProductCursorPagination.is_requested(self.request):
+            self._paginator = ProductCursorPagination()
+        return super().paginator
+
+
+class FacetView(CatalogCacheMixin, GenericAPIView):
+    """
+    Класс для подсчета предложений по категориям, магазинам и значениям
+    параметров с учетом фильтров поиска товаров
+
+    Счетчики категорий и магазинов не учитывают собственный фильтр,
+    чтобы показывать число предложений для соседних вариантов. Поэтому
+    ответ с фильтром магазина зависит от всего каталога и кэшируется
+    по общей версии каталога.
+    """
+    queryset = CatalogOffer.objects.all()
+    filterset_class = ProductFilter
+    # число самых частых значений каждого параметра
+    values_limit = 20
+
+    def get(self, request, *args, **kwargs):
+        return self.cached(request, self.get_facets)
+
+    def filter_offers(self, exclude=None):
+        data = self.request.query_params.copy()
+        data.pop(exclude, None)
+        filterset = self.filterset_class(data, self.get_queryset(),
+                                         request=self.request)
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        # ранжирование поиска не нужно для подсчета
+        return filterset.qs.order_by()
+
+    def get_facets(self):
+        offers = self.filter_offers()
+        categories = self.filter_offers('category_id')\
+            .values(id=F('category_id'), name=F('category_name'))\
+            .annotate(count=Count('pk')).order_by('-count', 'id')
+        shops = self.filter_offers('shop_id')\
+            .values(id=F('shop_id'), name=F('shop__name'))\
+            .annotate(count=Count('pk')).order_by('-count', 'id')
+        values = ProductParameter.objects\
+            .filter(product_info_id__in=offers.values('pk'))\
+            .values('parameter__name', 'value')\
+            .annotate(count=Count('id'))\
+            .order_by('parameter__name', '-count', 'value')
+
+        parameters = {}
+        for item in values:
+            parameter = parameters.setdefault(item['parameter__name'], [])
+            if len(parameter) < self.values_limit:
+                parameter.append({'value': item['value'],
+                                  'count': item['count']})
+        return {'count': offers.count(),
+                'categories': list(categories),
+                'shops': list(shops),
+                'parameters': [{'name': name, 'values': parameter_values}
+                               for name, parameter_values
+                               in parameters.items()]}